@@ -1,100 +1,560 @@
 import os
+import sys
 import fitz  # PyMuPDF
 import hashlib
-import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
 from PIL import Image
-import base64
+import numpy as np
+import html
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 import re
 import webbrowser
+from extract_cache import ExtractCache
+from instrumentation import current_report
+
+# 图片提取逻辑变化时递增，使旧的缓存条目失效
+IMAGE_EXTRACTOR_VERSION = 3
 
 def get_image_hash(image_data):
     return hashlib.md5(image_data).hexdigest()
 
-def extract_images_from_pdf(pdf_path):
-    images = []
-    pdf_document = fitz.open(pdf_path)
-    for page_num in range(len(pdf_document)):
-        page = pdf_document.load_page(page_num)
-        image_list = page.get_images(full=True)
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = pdf_document.extract_image(xref)
-            image_data = base_image["image"]
-            images.append((f"page_{page_num + 1}_img_{img_index + 1}.png", image_data))
-    return sorted(images, key=lambda x: extract_page_number(x[0]))
-
-def compare_images(images1, images2):
-    images1_dict = {get_image_hash(img_data): (img_name, img_data) for img_name, img_data in images1}
-    images2_dict = {get_image_hash(img_data): (img_name, img_data) for img_name, img_data in images2}
-    
-    common_images = []
-    for hash_value in set(images1_dict.keys()) & set(images2_dict.keys()):
-        img1_name, img1_data = images1_dict[hash_value]
-        img2_name, img2_data = images2_dict[hash_value]
-        common_images.append((img1_name, img1_data, img2_name, img2_data))
-    
-    return sorted(common_images, key=lambda x: extract_page_number(x[0]))
-
-
-
-def save_images(images, output_dir, pdf_filenames):
-    for pdf_filename in pdf_filenames:
-        # 创建以 PDF 文件名为目录
-        pdf_output_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_filename))[0])
-        os.makedirs(pdf_output_dir, exist_ok=True)
-        
-        # 保存图片到对应的目录
-        for img_name, img_data in images:
-            img_path = os.path.join(pdf_output_dir, img_name)
-            # 将 bytes 转换为 PIL.Image 对象
-            image = Image.open(BytesIO(img_data))
-            image.save(img_path)
-            #print(f"Saved {img_path}")
-
-def generate_html(common_images, output_dir):
-    html_content = '<html><head><title>PDF Image Comparison Result</title></head><body>\n'
-    html_content += '<h1>PDF 图片对比结果</h1>\n'
-
-    if not common_images:
-        html_content += '<p>No common images found between the two PDFs(俩个文件中没有相同图片).</p>\n'
+# ================== 感知哈希 ==================
+# 感知哈希在缩小后的灰度图上计算，对重新编码、缩放、压缩不敏感，两张图片哈希的
+# 汉明距离越小越相似
+HASH_SIZE = 8
+PHASH_SAMPLE_SIZE = 32
+MIN_IMAGE_SIZE = 16  # 宽或高小于该值的图片（线条、蒙版等）不计算感知哈希
+DEFAULT_MAX_DISTANCE = 10
+
+def load_grayscale(image_data, size):
+    """解码图片并缩放为 size = (宽, 高) 的灰度矩阵；图片过小或为纯色时返回None"""
+    image = Image.open(BytesIO(image_data))
+    if image.width < MIN_IMAGE_SIZE or image.height < MIN_IMAGE_SIZE:
+        return None
+    image.draft('L', (size[0] * 2, size[1] * 2))  # JPEG 可以直接按缩小后的尺寸解码
+    pixels = np.asarray(image.convert('L').resize(size, Image.LANCZOS), dtype=np.float64)
+    if pixels.std() < 1:
+        return None
+    return pixels
+
+def bits_to_int(bits):
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+def average_hash(image_data):
+    pixels = load_grayscale(image_data, (HASH_SIZE, HASH_SIZE))
+    if pixels is None:
+        return None
+    return bits_to_int(pixels > pixels.mean())
+
+def difference_hash(image_data):
+    pixels = load_grayscale(image_data, (HASH_SIZE + 1, HASH_SIZE))
+    if pixels is None:
+        return None
+    return bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def dct_matrix(n):
+    """DCT-II变换矩阵"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+_DCT = dct_matrix(PHASH_SAMPLE_SIZE)
+
+def dct_hash(pixels):
+    """32x32灰度矩阵做二维DCT，取左上角8x8低频系数与中位数比较"""
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return bits_to_int(low > np.median(low.flatten()[1:]))  # 中位数不计直流分量
+
+def perceptual_hash(image_data):
+    """pHash：32x32灰度图做二维DCT，取左上角8x8低频系数与中位数比较"""
+    pixels = load_grayscale(image_data, (PHASH_SAMPLE_SIZE, PHASH_SAMPLE_SIZE))
+    if pixels is None:
+        return None
+    return dct_hash(pixels)
+
+HASH_METHODS = {
+    'ahash': average_hash,
+    'dhash': difference_hash,
+    'phash': perceptual_hash,
+}
+
+def hamming_distance(hash1, hash2):
+    return (hash1 ^ hash2).bit_count()
+
+class BKTree:
+    """按汉明距离组织的BK树，查询与某哈希距离不超过阈值的所有条目时无需两两比较"""
+
+    def __init__(self):
+        self.root = None  # 节点为 [哈希, 条目列表, {距离: 子节点}]
+
+    def add(self, key, value):
+        if self.root is None:
+            self.root = [key, [value], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key, max_distance):
+        """返回[(距离, 条目)]，按距离从小到大排序"""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(key, node[0])
+            if distance <= max_distance:
+                results.extend((distance, value) for value in node[1])
+            # 三角不等式：只有与当前节点距离在 [d - max, d + max] 内的子树可能命中
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results, key=lambda x: x[0])
+
+def digest_xref(pdf_document, xref, hash_function):
+    """计算单个图片对象的(md5, 扩展名, 感知哈希)
+
+    md5直接对PDF中的原始图片流计算，不经过解码；感知哈希需要像素，只在这里解码一次。
+    """
+    raw_stream = pdf_document.xref_stream_raw(xref)
+    base_image = pdf_document.extract_image(xref)
+    digest = get_image_hash(raw_stream if raw_stream else base_image["image"])
+    try:
+        image_hash = hash_function(base_image["image"])
+    except Exception:
+        image_hash = None  # PIL无法解码的格式只参与md5比较
+    return digest, base_image["ext"], None if image_hash is None else f"{image_hash:016x}"
+
+def iter_image_digests(pdf_path, hash_function):
+    """按页码顺序逐个产出图片的[文件名, xref, md5, 感知哈希]
+
+    每次只解码一张图片，得到摘要后即释放图片数据；同一个xref在多页重复出现
+    （如页眉logo）时只提取、哈希一次。
+    """
+    xref_digests = {}  # xref -> (md5, 扩展名, 感知哈希)
+    with fitz.open(pdf_path) as pdf_document:
+        for page_num in range(len(pdf_document)):
+            page = pdf_document.load_page(page_num)
+            for img_index, img in enumerate(page.get_images(full=True)):
+                xref = img[0]
+                if xref not in xref_digests:
+                    xref_digests[xref] = digest_xref(pdf_document, xref, hash_function)
+                digest, ext, image_hash = xref_digests[xref]
+                yield [f"page_{page_num + 1}_img_{img_index + 1}.{ext}", xref, digest, image_hash]
+
+def extract_image_digests(pdf_path, cache=None, method='phash'):
+    """提取PDF中每张图片的[文件名, xref, md5, 感知哈希]，传入cache时命中缓存可跳过解析
+
+    文件名的扩展名为图片的原始格式；感知哈希以十六进制字符串保存，无法计算时为None。
+    """
+    if method not in HASH_METHODS:
+        raise ValueError(f"不支持的感知哈希算法: {method}")
+    hash_function = HASH_METHODS[method]
+
+    def extract():
+        return list(iter_image_digests(pdf_path, hash_function))
+
+    if cache is None:
+        return extract()
+    return cache.get_or_extract('image', pdf_path, IMAGE_EXTRACTOR_VERSION, {'method': method}, extract)
+
+def extract_image_md5s(pdf_path, cache=None):
+    """只提取PDF中图片的md5列表（去重，按首次出现顺序），不解码图片
+
+    md5与extract_image_digests的结果一致，直接对原始图片流计算，原始流为空时才提取图片；
+    供只按md5比较的语料库索引使用，省去计算感知哈希的解码开销。
+    """
+    def extract():
+        digests = {}  # xref -> md5
+        with fitz.open(pdf_path) as pdf_document:
+            for page in pdf_document:
+                for img in page.get_images(full=True):
+                    xref = img[0]
+                    if xref not in digests:
+                        raw_stream = pdf_document.xref_stream_raw(xref)
+                        digests[xref] = get_image_hash(
+                            raw_stream if raw_stream else pdf_document.extract_image(xref)["image"])
+        return list(dict.fromkeys(digests.values()))
+
+    if cache is None:
+        return extract()
+    return cache.get_or_extract('image', pdf_path, IMAGE_EXTRACTOR_VERSION, {'method': 'md5'}, extract)
+
+def compare_image_digests(digests1, digests2, max_distance=DEFAULT_MAX_DISTANCE):
+    """两级比较两组图片摘要，返回[(文件名1, xref1, 文件名2, xref2, 汉明距离)]
+
+    第一级按md5找出字节完全相同的图片（距离记为0）；第二级把其余图片的感知哈希
+    建成BK树，为文档1中的每个感知哈希找出距离不超过max_distance的最近图片。
+    max_distance为负数时只做md5比较。
+    """
+    digests1_dict = {digest: (img_name, xref) for img_name, xref, digest, _ in digests1}
+    digests2_dict = {digest: (img_name, xref) for img_name, xref, digest, _ in digests2}
+
+    common = []
+    exact = set(digests1_dict.keys()) & set(digests2_dict.keys())
+    for hash_value in exact:
+        common.append(digests1_dict[hash_value] + digests2_dict[hash_value] + (0,))
+
+    if max_distance >= 0:
+        tree = BKTree()
+        for img_name, xref, digest, phash in digests2:
+            if phash is not None and digest not in exact:
+                tree.add(int(phash, 16), (img_name, xref))
+        seen = set()
+        for img_name, xref, digest, phash in digests1:
+            if phash is None or digest in exact or phash in seen:
+                continue
+            seen.add(phash)
+            found = tree.search(int(phash, 16), max_distance)
+            if found:
+                distance, (img2_name, xref2) = found[0]
+                common.append((img_name, xref, img2_name, xref2, distance))
+
+    return sorted(common, key=lambda x: extract_page_number(x[0]))
+
+def save_image(image_data, output_dir, img_name, image_format=None):
+    """保存一张图片，返回写出的文件路径
+
+    默认直接写出图片的原始字节，不经过解码；指定image_format（如 'png'）时
+    才用PIL转换格式并替换扩展名。
+    """
+    if image_format:
+        img_path = os.path.join(output_dir, f"{os.path.splitext(img_name)[0]}.{image_format}")
+        Image.open(BytesIO(image_data)).save(img_path)
     else:
-        html_content += '<table>\n'
-        for img1_name, img1_data, img2_name, img2_data in common_images:
-            img1_base64 = base64.b64encode(img1_data).decode('utf-8')
-            img2_base64 = base64.b64encode(img2_data).decode('utf-8')
-            html_content += '<tr>\n'
-            html_content += f'<td><img src="data:image/png;base64,{img1_base64}" alt="{img1_name}"> (Page: {extract_page_number(img1_name)})</td>\n'
-            html_content += f'<td><img src="data:image/png;base64,{img2_base64}" alt="{img2_name}"> (Page: {extract_page_number(img2_name)})</td>\n'
-            html_content += '</tr>\n'
-        html_content += '</table>\n'
-
-    html_content += '</body></html>\n'
-    
-    html_path = os.path.join(output_dir, 'result.html')
-    with open(html_path, 'w') as f:
-        f.write(html_content)
-    
+        img_path = os.path.join(output_dir, img_name)
+        with open(img_path, 'wb') as f:
+            f.write(image_data)
+    return img_path
+
+def export_images(pdf_path, entries, output_dir, image_format=None):
+    """把[(文件名, xref)]对应的图片写入 output_dir/PDF文件名/，返回 文件名 -> 路径
+
+    每次只在内存中保留一张图片，同一xref只提取一次；image_format见save_image。
+    """
+    pdf_output_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0])
+    os.makedirs(pdf_output_dir, exist_ok=True)
+
+    names_by_xref = defaultdict(list)
+    for img_name, xref in entries:
+        names_by_xref[xref].append(img_name)
+
+    paths = {}
+    with fitz.open(pdf_path) as pdf_document:
+        for xref, img_names in names_by_xref.items():
+            image_data = pdf_document.extract_image(xref)["image"]
+            for img_name in img_names:
+                paths[img_name] = save_image(image_data, pdf_output_dir, img_name, image_format)
+    return paths
+
+# ================== 整页栅格比对 ==================
+# 以上比对只能发现嵌入的图片对象；矢量绘制的图表、线条画的表格、重新编码的整页扫描件
+# 要把整页渲染成低分辨率灰度图后再比较。每页的签名为32x32块均值及其pHash：pHash用于
+# BK树检索候选页，块均值用于对候选页做相关系数校验，排除版式相近的普通文字页。
+PAGE_RASTER_VERSION = 1
+RASTER_DPI = 36  # A4页面约 298x421 像素，足够区分版面又渲染得快
+RASTER_MIN_STD = 2.0  # 灰度标准差低于该值的页（空白页）不参与比对
+DEFAULT_PAGE_MAX_DISTANCE = 8
+DEFAULT_MIN_CORRELATION = 0.97
+EXPORT_DPI = 72
+
+def block_means(pixels, rows, cols):
+    """把灰度矩阵划分为rows x cols个块，返回各块的均值矩阵（要求宽高不小于块数）"""
+    height, width = pixels.shape
+    row_edges = np.linspace(0, height, rows + 1).astype(np.intp)
+    col_edges = np.linspace(0, width, cols + 1).astype(np.intp)
+    sums = np.add.reduceat(np.add.reduceat(pixels, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+
+def page_pixels(page, dpi):
+    """把页面渲染为灰度矩阵"""
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    samples = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+    return samples[:, :pixmap.width].astype(np.float64)
+
+def render_page_signatures(pdf_path, start, end, dpi=RASTER_DPI):
+    """渲染第start页到第end页(不含，从0开始计)，返回[页码, pHash, 32x32块均值]
+
+    空白页或尺寸过小的页pHash和块均值为None。在进程池中按页码区间分片调用。
+    """
+    signatures = []
+    with fitz.open(pdf_path) as pdf_document:
+        for page_num in range(start, min(end, len(pdf_document))):
+            pixels = page_pixels(pdf_document.load_page(page_num), dpi)
+            if min(pixels.shape) < PHASH_SAMPLE_SIZE or pixels.std() < RASTER_MIN_STD:
+                signatures.append([page_num + 1, None, None])
+                continue
+            grid = block_means(pixels, PHASH_SAMPLE_SIZE, PHASH_SAMPLE_SIZE)
+            signatures.append([page_num + 1, f"{dct_hash(grid):016x}", np.rint(grid).astype(np.uint8).flatten().tolist()])
+    return signatures
+
+def extract_page_signatures(pdf_path, cache=None, workers=1, dpi=RASTER_DPI):
+    """渲染PDF每一页并计算签名，workers > 1 时按页码区间分片到进程池并行渲染"""
+    def extract():
+        with fitz.open(pdf_path) as pdf_document:
+            page_count = len(pdf_document)
+        if workers <= 1:
+            return render_page_signatures(pdf_path, 0, page_count, dpi)
+        chunk = max(1, -(-page_count // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render_page_signatures, pdf_path, start, start + chunk, dpi)
+                       for start in range(0, page_count, chunk)]
+            return [signature for future in futures for signature in future.result()]
+
+    if cache is None:
+        return extract()
+    return cache.get_or_extract('raster', pdf_path, PAGE_RASTER_VERSION, {'dpi': dpi}, extract)
+
+def grid_vectors(signatures):
+    """把块均值转换为零均值、单位长度的行向量，两行的点积即相关系数"""
+    grids = np.array([grid for _, _, grid in signatures], dtype=np.float64).reshape(len(signatures), -1)
+    grids -= grids.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(grids, axis=1, keepdims=True)
+    return grids / np.where(norms == 0, 1, norms)
+
+def page_raster_name(page_number):
+    return f"page_{page_number}_raster.png"
+
+def compare_page_signatures(signatures1, signatures2, max_distance=DEFAULT_PAGE_MAX_DISTANCE,
+                            min_correlation=DEFAULT_MIN_CORRELATION):
+    """找出相似的页面对，返回[(文件名1, 页码1, 文件名2, 页码2, 汉明距离)]
+
+    文档2的页面pHash建成BK树，文档1的每一页只与汉明距离不超过max_distance的候选页
+    计算块均值的相关系数，取不低于min_correlation的候选中距离最近（其次相关系数最高）的一页。
+    """
+    signatures1 = [signature for signature in signatures1 if signature[1] is not None]
+    signatures2 = [signature for signature in signatures2 if signature[1] is not None]
+    if not signatures1 or not signatures2:
+        return []
+    vectors1 = grid_vectors(signatures1)
+    vectors2 = grid_vectors(signatures2)
+
+    tree = BKTree()
+    for idx, (_, phash, _) in enumerate(signatures2):
+        tree.add(int(phash, 16), idx)
+
+    common = []
+    for idx1, (page1, phash, _) in enumerate(signatures1):
+        found = tree.search(int(phash, 16), max_distance)
+        if not found:
+            continue
+        distances = np.array([distance for distance, _ in found])
+        candidates = np.array([idx2 for _, idx2 in found])
+        correlations = vectors2[candidates] @ vectors1[idx1]
+        accepted = np.flatnonzero(correlations >= min_correlation)
+        if not len(accepted):
+            continue
+        best = accepted[np.lexsort((-correlations[accepted], distances[accepted]))[0]]
+        page2 = signatures2[candidates[best]][0]
+        common.append((page_raster_name(page1), page1, page_raster_name(page2), page2, int(distances[best])))
+    return common
+
+def export_page_rasters(pdf_path, entries, output_dir, dpi=EXPORT_DPI):
+    """把[(文件名, 页码)]对应的页面渲染为PNG写入 output_dir/PDF文件名/，返回 文件名 -> 路径"""
+    pdf_output_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0])
+    os.makedirs(pdf_output_dir, exist_ok=True)
+
+    paths = {}
+    with fitz.open(pdf_path) as pdf_document:
+        for img_name, page_number in entries:
+            if img_name not in paths:
+                img_path = os.path.join(pdf_output_dir, img_name)
+                pdf_document.load_page(page_number - 1).get_pixmap(dpi=dpi).save(img_path)
+                paths[img_name] = img_path
+    return paths
+
+ROWS_PER_PAGE = 50
+
+HTML_HEAD = '''<html><head><meta charset="utf-8"><title>PDF Image Comparison Result</title>
+<style>
+img { max-width: 480px; max-height: 480px; }
+td { vertical-align: top; padding: 8px; border-bottom: 1px solid #ccc; }
+#pager button { margin: 0 4px; }
+</style>
+</head><body>
+<h1>%s</h1>
+'''
+
+# 结果页的标题、无结果时的提示
+HTML_TEXTS = {
+    'images': ('PDF 图片对比结果', 'No common images found between the two PDFs(俩个文件中没有相同图片).'),
+    'pages': ('PDF 整页对比结果', 'No similar pages found between the two PDFs(俩个文件中没有相似页面).'),
+}
+
+# 分页脚本：只显示当前页的行，配合 loading="lazy" 其余行的图片不会被加载
+HTML_PAGER = '''<div id="pager"></div>
+<script>
+const rows = Array.from(document.querySelectorAll('#result tr'));
+const pageSize = %d;
+const pageCount = Math.ceil(rows.length / pageSize);
+function showPage(page) {
+    rows.forEach((row, i) => { row.style.display = (i >= page * pageSize && i < (page + 1) * pageSize) ? '' : 'none'; });
+    const pager = document.getElementById('pager');
+    pager.innerHTML = '';
+    for (let p = 0; p < pageCount; p++) {
+        const button = document.createElement('button');
+        button.textContent = p + 1;
+        button.disabled = p === page;
+        button.onclick = () => { showPage(p); window.scrollTo(0, 0); };
+        pager.appendChild(button);
+    }
+}
+if (rows.length) { showPage(0); }
+</script>
+'''
+
+def image_url(img_path, output_dir):
+    """result.html 引用图片用的相对URL"""
+    return urllib.parse.quote(os.path.relpath(img_path, output_dir).replace(os.sep, '/'))
+
+def render_row(img1_name, img1_path, img2_name, img2_path, distance, output_dir, kind='images'):
+    # 整页比对的距离为0只说明渲染结果相近，不代表字节相同
+    similarity = '完全相同' if distance == 0 and kind == 'images' else f'汉明距离 {distance}'
+    return (
+        '<tr>\n'
+        f'<td><img src="{image_url(img1_path, output_dir)}" alt="{html.escape(img1_name)}" loading="lazy"> '
+        f'(Page: {extract_page_number(img1_name)})</td>\n'
+        f'<td><img src="{image_url(img2_path, output_dir)}" alt="{html.escape(img2_name)}" loading="lazy"> '
+        f'(Page: {extract_page_number(img2_name)})</td>\n'
+        f'<td>{similarity}</td>\n'
+        '</tr>\n'
+    )
+
+def generate_html(common_images, output_dir, page_size=ROWS_PER_PAGE, filename='result.html', kind='images'):
+    """逐行写出 result.html，图片以相对路径引用已保存的文件
+
+    common_images 为可迭代的 (文件名1, 路径1, 文件名2, 路径2, 汉明距离)，
+    生成过程中只保留当前一行的内容。kind 为 images 或 pages，决定标题和无结果时的提示。
+    """
+    title, empty_message = HTML_TEXTS[kind]
+    html_path = os.path.join(output_dir, filename)
+    count = 0
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(HTML_HEAD % title)
+        for row in common_images:
+            if count == 0:
+                f.write('<table id="result">\n')
+            f.write(render_row(*row, output_dir, kind))
+            count += 1
+        if count:
+            f.write('</table>\n')
+            f.write(HTML_PAGER % page_size)
+        else:
+            f.write(f'<p>{empty_message}</p>\n')
+        f.write('</body></html>\n')
+
     return html_path
     
 def extract_page_number(filename):
-    match = re.search(r'page_(\d+)_img_\d+\.\w+', filename)
+    match = re.search(r'page_(\d+)_(?:img_\d+|raster)\.\w+', filename)
     if match:
         return int(match.group(1))
     return None
 
+def compare_pdf_images(file1_path, file2_path, output_dir='static/output', cache=None,
+                       max_distance=DEFAULT_MAX_DISTANCE, image_format=None):
+    """比对两个PDF中的图片，导出相同的图片并生成result.html，不依赖图形界面
+
+    image_format为空时导出图片的原始字节，否则转换为该格式（如 'png'）。
+
+    返回 {'common_images': 相同图片对数, 'html': result.html路径}
+    """
+    report = current_report()
+
+    # 提取图片摘要（参考文档的摘要命中缓存时不再解析）
+    with report.stage('extract_images'):
+        digests1 = extract_image_digests(file1_path, cache)
+        digests2 = extract_image_digests(file2_path, cache)
+    report.count('extract_images', images=len(digests1) + len(digests2))
+
+    # 比较图片（md5完全相同或感知哈希相近）
+    with report.stage('compare_images'):
+        common = compare_image_digests(digests1, digests2, max_distance)
+    report.count('compare_images', matches=len(common))
+
+    # 保存图片：只导出相同的图片，分别写入各自PDF文件名的目录
+    with report.stage('export_images'):
+        paths1 = export_images(file1_path, [(img1_name, xref1) for img1_name, xref1, _, _, _ in common],
+                               output_dir, image_format)
+        paths2 = export_images(file2_path, [(img2_name, xref2) for _, _, img2_name, xref2, _ in common],
+                               output_dir, image_format)
+    report.count('export_images', files=len(paths1) + len(paths2),
+                 bytes=sum(os.path.getsize(path) for paths in (paths1, paths2) for path in paths.values()))
+
+    # 生成 HTML 文件
+    with report.stage('generate_html'):
+        html_path = generate_html(
+            ((img1_name, paths1[img1_name], img2_name, paths2[img2_name], distance)
+             for img1_name, _, img2_name, _, distance in common),
+            output_dir
+        )
+    report.count('generate_html', rows=len(common), bytes=os.path.getsize(html_path))
+    return {'common_images': len(common), 'html': html_path}
+
+PAGES_HTML_FILE = 'pages.html'
+
+def compare_pdf_pages(file1_path, file2_path, output_dir='static/output', cache=None,
+                      max_distance=DEFAULT_PAGE_MAX_DISTANCE, min_correlation=DEFAULT_MIN_CORRELATION, workers=1):
+    """把两个PDF的每一页渲染后比对，导出相似页面的PNG并生成pages.html
+
+    返回 {'common_pages': 相似页面对数, 'html': pages.html路径}
+    """
+    report = current_report()
+
+    with report.stage('render_pages'):
+        signatures1 = extract_page_signatures(file1_path, cache, workers)
+        signatures2 = extract_page_signatures(file2_path, cache, workers)
+    report.count('render_pages', pages=len(signatures1) + len(signatures2))
+
+    with report.stage('compare_pages'):
+        common = compare_page_signatures(signatures1, signatures2, max_distance, min_correlation)
+    report.count('compare_pages', matches=len(common))
+
+    with report.stage('export_pages'):
+        paths1 = export_page_rasters(file1_path, [(name1, page1) for name1, page1, _, _, _ in common], output_dir)
+        paths2 = export_page_rasters(file2_path, [(name2, page2) for _, _, name2, page2, _ in common], output_dir)
+    report.count('export_pages', files=len(paths1) + len(paths2),
+                 bytes=sum(os.path.getsize(path) for paths in (paths1, paths2) for path in paths.values()))
+
+    with report.stage('generate_html'):
+        html_path = generate_html(
+            ((name1, paths1[name1], name2, paths2[name2], distance) for name1, _, name2, _, distance in common),
+            output_dir, filename=PAGES_HTML_FILE, kind='pages'
+        )
+    report.count('generate_html', rows=len(common), bytes=os.path.getsize(html_path))
+    return {'common_pages': len(common), 'html': html_path}
+
+
 def main():
-    root = tk.Tk()
-    root.withdraw()  # 隐藏主窗口
+    # 命令行直接给出两个PDF时不弹出对话框；tkinter只在需要时导入
+    if len(sys.argv) == 3:
+        file_paths = sys.argv[1:]
+    else:
+        import tkinter as tk
+        from tkinter import filedialog, messagebox
+
+        root = tk.Tk()
+        root.withdraw()  # 隐藏主窗口
 
-    # 选择两个 PDF 文件
-    file_paths = filedialog.askopenfilenames(title="请选择俩个PDF文件", filetypes=[("PDF files", "*.pdf")])
-    if len(file_paths) != 2:
-        print("请按Ctrl键选中俩个PDF文件")
-        
-        messagebox.showerror("错误", "请按Ctrl键选中俩个PDF文件")
-        return
+        # 选择两个 PDF 文件
+        file_paths = filedialog.askopenfilenames(title="请选择俩个PDF文件", filetypes=[("PDF files", "*.pdf")])
+        if len(file_paths) != 2:
+            print("请按Ctrl键选中俩个PDF文件")
+
+            messagebox.showerror("错误", "请按Ctrl键选中俩个PDF文件")
+            return
 
     file1_path = file_paths[0]
     file2_path = file_paths[1]
@@ -102,26 +562,12 @@ def main():
     print(f"File 1: {file1_path}")
     print(f"File 2: {file2_path}")
 
-    # 提取图片
-    images1 = extract_images_from_pdf(file1_path)
-    images2 = extract_images_from_pdf(file2_path)
-
-    # 比较图片
-    common_images = compare_images(images1, images2)
-
-    pdf_filenames = [file1_path, file2_path]
-    # 保存图片
-    output_dir = 'static/output'
-    file_01=output_dir+""
-    save_images([(img1_name, img1_data) for img1_name, img1_data, _, _ in common_images], output_dir,pdf_filenames)
-
-    # 生成 HTML 文件
-    html_path = generate_html(common_images, output_dir)
+    result = compare_pdf_images(file1_path, file2_path, 'static/output', ExtractCache())
 
     # 自动打开生成的 HTML 文件
-    webbrowser.open(html_path)
+    webbrowser.open(result['html'])
 
-    print(f"Result saved to {html_path}")
+    print(f"Result saved to {result['html']}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+性能基准
+用reportlab和python-docx生成规模可控的合成文档对（页数、每页行数、植入的相同段落
+和相同图片，中英文混排），在独立子进程中逐个运行比对流程的各个阶段，记录耗时、
+峰值内存以及对植入内容的召回率，结果可以保存为基线并在之后检查是否变慢。
+
+命令行：
+    python benchmark.py                    运行并打印结果
+    python benchmark.py --save-baseline    运行并保存为基线
+    python benchmark.py --check            与基线比较，有阶段变慢或召回率下降时返回1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import platform
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from PIL import Image, ImageDraw
+from docx import Document
+from docx.enum.text import WD_BREAK
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+from compare import (compare_pdfs, compare_docs_with_threshold, extract_paragraphs_parallel, remove_special_chars,
+                     OUTPUT_FILES)
+from ExtractImageFromPdf import extract_image_digests, compare_image_digests, extract_page_number
+from instrumentation import peak_rss_mb
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'benchmark_baseline.json')
+STAGE_NAMES = ('pdf_extract', 'pdf_text', 'docx_text', 'pdf_images')
+
+# 页面排版（单位pt）：文字在左侧，图片在右侧一列
+CJK_FONT = 'STSong-Light'
+FONT_SIZE = 10
+LINE_HEIGHT = 16
+MARGIN = 50
+TEXT_WIDTH = 330
+IMAGE_SIZE = 110
+IMAGE_X = 420
+IMAGE_SLOTS = 6  # 每页最多放置的图片数
+IMAGE_PIXELS = 128
+
+LATIN_SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'xe', 'zu', 'ban', 'dor', 'fen', 'gil', 'hum',
+                   'jat', 'kor', 'lin', 'mar', 'nop', 'qua', 'rin', 'sol', 'tek', 'ulm', 'ver', 'wex', 'yor']
+
+
+def cjk_alphabet():
+    """GB2312一级汉字，STSong-Light字体都能显示，提取文本时可以可靠地还原"""
+    chars = []
+    for row in range(0xB0, 0xD8):
+        for col in range(0xA1, 0xFF):
+            try:
+                chars.append(bytes([row, col]).decode('gb2312'))
+            except UnicodeDecodeError:
+                pass
+    return chars
+
+
+class TextGenerator:
+    """生成中英文混排的随机文本行：汉字词组中夹杂英文单词和数字"""
+
+    def __init__(self, rng, latin_ratio):
+        self.rng = rng
+        self.latin_ratio = latin_ratio
+        self.alphabet = cjk_alphabet()
+
+    def latin_word(self):
+        return ''.join(self.rng.choice(LATIN_SYLLABLES) for _ in range(self.rng.randint(1, 3)))
+
+    def line(self, min_cjk=0):
+        """生成一行不超过TEXT_WIDTH宽的文本，其中至少有min_cjk个汉字"""
+        tokens = []
+        cjk_count = 0
+        width = 0
+        while True:
+            if self.rng.random() < self.latin_ratio:
+                token = self.latin_word() if self.rng.random() < 0.8 else str(self.rng.randint(1, 9999))
+                token = f" {token} "
+            else:
+                token = ''.join(self.rng.choice(self.alphabet) for _ in range(self.rng.randint(2, 6)))
+            token_width = pdfmetrics.stringWidth(token, CJK_FONT, FONT_SIZE)
+            if width + token_width > TEXT_WIDTH:
+                if cjk_count >= min_cjk:
+                    break
+                tokens, cjk_count, width = [], 0, 0  # 汉字不够时整行重新生成
+                continue
+            tokens.append(token)
+            width += token_width
+            cjk_count += len(remove_special_chars(token))
+        return ''.join(tokens).strip()
+
+
+def random_image(rng):
+    """由随机的矩形和椭圆组成的图片，感知哈希区分度高"""
+    image = Image.new('RGB', (IMAGE_PIXELS, IMAGE_PIXELS), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(4, 9)):
+        x0, y0 = rng.randrange(IMAGE_PIXELS), rng.randrange(IMAGE_PIXELS)
+        x1, y1 = x0 + rng.randint(10, 70), y0 + rng.randint(10, 70)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle([x0, y0, x1, y1], fill=color)
+        else:
+            draw.ellipse([x0, y0, x1, y1], fill=color)
+    return image
+
+
+def near_duplicate(image, rng, amount=6):
+    """在每个像素上加入小幅噪声，字节不同但视觉上相同"""
+    noisy = image.copy()
+    pixels = noisy.load()
+    for y in range(noisy.height):
+        for x in range(noisy.width):
+            pixels[x, y] = tuple(min(255, max(0, c + rng.randint(-amount, amount))) for c in pixels[x, y])
+    return noisy
+
+
+def plant_positions(rng, count, slots):
+    """从slots个位置中不重复地选出count个"""
+    if count > slots:
+        raise ValueError(f"植入数量{count}超过可用位置{slots}")
+    return rng.sample(range(slots), count)
+
+
+def generate_corpus(corpus_dir, pages=20, lines=40, planted=50, images=6, latin_ratio=0.3, min_length=13, seed=1):
+    """生成一对PDF和一对DOCX以及植入内容的真值，返回传给各阶段的spec"""
+    # 植入行的汉字部分取最小匹配长度的两倍，但一行最多放下约TEXT_WIDTH / FONT_SIZE个汉字
+    planted_cjk = min(2 * min_length, TEXT_WIDTH // FONT_SIZE - 3)
+    if planted_cjk < min_length:
+        raise ValueError(f"最小匹配长度{min_length}超过一行能容纳的汉字数")
+    pdfmetrics.registerFont(UnicodeCIDFont(CJK_FONT))
+    rng = random.Random(seed)
+    generator = TextGenerator(rng, latin_ratio)
+    os.makedirs(corpus_dir, exist_ok=True)
+    total_lines = pages * lines
+
+    # 文本：两份文档各自生成随机行，再把植入段落放到随机位置
+    docs = [[generator.line() for _ in range(total_lines)] for _ in range(2)]
+    planted_text = []
+    planted_pairs = []
+    for pos1, pos2 in zip(plant_positions(rng, planted, total_lines), plant_positions(rng, planted, total_lines)):
+        text = generator.line(min_cjk=planted_cjk)
+        docs[0][pos1] = text
+        docs[1][pos2] = text
+        planted_text.append(text)
+        planted_pairs.append([pos1, pos2])
+
+    # 图片：一半完全相同，一半加噪声的近似图片，另有各自独有的干扰图片
+    slots = pages * IMAGE_SLOTS
+    placements = [{}, {}]  # 位置 -> 图片
+    planted_images = []
+    positions1 = plant_positions(rng, 2 * images, slots)
+    positions2 = plant_positions(rng, 2 * images, slots)
+    for k in range(images):
+        image = random_image(rng)
+        pos1, pos2 = positions1[k], positions2[k]
+        placements[0][pos1] = image
+        placements[1][pos2] = image if k % 2 == 0 else near_duplicate(image, rng)
+        planted_images.append([pos1 // IMAGE_SLOTS + 1, pos2 // IMAGE_SLOTS + 1])
+    for k in range(images, 2 * images):
+        placements[0][positions1[k]] = random_image(rng)
+        placements[1][positions2[k]] = random_image(rng)
+
+    spec = {'min_length': min_length, 'planted_text': planted_text, 'planted_pairs': planted_pairs,
+            'planted_images': planted_images}
+    for idx, (doc_lines, doc_images) in enumerate(zip(docs, placements), start=1):
+        spec[f'pdf{idx}'] = write_pdf(os.path.join(corpus_dir, f'bench{idx}.pdf'), doc_lines, doc_images, pages, lines)
+        spec[f'docx{idx}'] = write_docx(os.path.join(corpus_dir, f'bench{idx}.docx'), doc_lines, lines)
+    return spec
+
+
+def write_pdf(path, doc_lines, images, pages, lines):
+    # invariant=1 去掉创建时间等可变信息，同样的参数生成的文件逐字节相同
+    pdf = canvas.Canvas(path, pagesize=A4, invariant=1)
+    _, page_height = A4
+    for page in range(pages):
+        pdf.setFont(CJK_FONT, FONT_SIZE)
+        for line in range(lines):
+            pdf.drawString(MARGIN, page_height - MARGIN - line * LINE_HEIGHT, doc_lines[page * lines + line])
+        for slot in range(IMAGE_SLOTS):
+            image = images.get(page * IMAGE_SLOTS + slot)
+            if image is not None:
+                y = page_height - MARGIN - (slot + 1) * (IMAGE_SIZE + 10)
+                pdf.drawImage(ImageReader(image), IMAGE_X, y, IMAGE_SIZE, IMAGE_SIZE)
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+def write_docx(path, doc_lines, lines):
+    document = Document()
+    for idx, text in enumerate(doc_lines):
+        paragraph = document.add_paragraph(text)
+        if (idx + 1) % lines == 0 and idx + 1 < len(doc_lines):
+            paragraph.add_run().add_break(WD_BREAK.PAGE)
+    document.save(path)
+    return path
+
+
+# ================== 各阶段 ==================
+# 每个阶段在独立的子进程中执行，返回包含wall_time的指标；计时不含模块导入和结果校验
+
+def stage_pdf_extract(spec):
+    start = time.perf_counter()
+    paragraphs1, paragraphs2 = extract_paragraphs_parallel([spec['pdf1'], spec['pdf2']], spec['min_length'],
+                                                           spec['workers'])
+    return {'wall_time': time.perf_counter() - start, 'lines': len(paragraphs1) + len(paragraphs2)}
+
+
+def stage_pdf_text(spec):
+    output_dir = tempfile.mkdtemp(dir=spec['work_dir'])
+    start = time.perf_counter()
+    count = compare_pdfs(spec['pdf1'], spec['pdf2'], output_dir, spec['min_length'], spec['engine'], spec['workers'],
+                         viewer_paths=False)
+    elapsed = time.perf_counter() - start
+    if count is None:
+        raise RuntimeError("PDF文本比对失败")
+
+    with open(os.path.join(output_dir, OUTPUT_FILES['json']), encoding='utf-8') as f:
+        records = json.load(f)['common_paragraphs']
+    substrings = {substring for record in records for substring in record['common_substrings']}
+    # 比对只看汉字，植入段落清洗后的汉字部分几乎整段被匹配到才算找到
+    found = 0
+    for text in spec['planted_text']:
+        cleaned = remove_special_chars(text)
+        if any(len(s) >= 0.9 * len(cleaned) and s in cleaned for s in substrings):
+            found += 1
+    return {'wall_time': elapsed, 'matches': count, 'recall': found / len(spec['planted_text'])}
+
+
+def stage_docx_text(spec):
+    start = time.perf_counter()
+    matches = compare_docs_with_threshold(spec['docx1'], spec['docx2'], spec['min_length'], use_renderer=False)
+    elapsed = time.perf_counter() - start
+    found = {(match['doc1_para'], match['doc2_para']) for match in matches}
+    recall = sum(tuple(pair) in found for pair in spec['planted_pairs']) / len(spec['planted_pairs'])
+    return {'wall_time': elapsed, 'matches': len(matches), 'recall': recall}
+
+
+def stage_pdf_images(spec):
+    start = time.perf_counter()
+    common = compare_image_digests(extract_image_digests(spec['pdf1']), extract_image_digests(spec['pdf2']))
+    elapsed = time.perf_counter() - start
+    found = {(extract_page_number(name1), extract_page_number(name2)) for name1, _, name2, _, _ in common}
+    truth = {tuple(pair) for pair in spec['planted_images']}
+    return {
+        'wall_time': elapsed,
+        'matches': len(common),
+        'recall': len(found & truth) / len(truth) if truth else 1.0,
+        'precision': len(found & truth) / len(found) if found else 1.0,
+    }
+
+
+STAGES = {
+    'pdf_extract': stage_pdf_extract,
+    'pdf_text': stage_pdf_text,
+    'docx_text': stage_docx_text,
+    'pdf_images': stage_pdf_images,
+}
+
+
+def measure_stage(name, spec):
+    metrics = STAGES[name](spec)
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    return metrics
+
+
+def run_benchmark(spec, stages, engines, repeat):
+    """每个阶段每次重复都在新的子进程(spawn)中运行，峰值内存互不影响；耗时取最小值"""
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in stages:
+        variants = [(f"{name}[{engine}]", {**spec, 'engine': engine}) for engine in engines] \
+            if name == 'pdf_text' else [(name, spec)]
+        for label, stage_spec in variants:
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(measure_stage, name, stage_spec).result())
+            result = {key: value for key, value in runs[-1].items() if key not in ('wall_time', 'peak_rss_mb')}
+            result['wall_time'] = round(min(run['wall_time'] for run in runs), 4)
+            result['wall_times'] = [round(run['wall_time'], 4) for run in runs]
+            rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+            result['peak_rss_mb'] = max(rss) if rss else None
+            results[label] = result
+            print(f"{label:<20} {result['wall_time']:>9.3f}s  峰值内存 {result['peak_rss_mb']} MB"
+                  + (f"  召回率 {result['recall']:.3f}" if 'recall' in result else ''), flush=True)
+    return results
+
+
+def check_regressions(current, baseline, tolerance):
+    """返回回归列表：耗时超过基线(1 + tolerance)倍，或召回率低于基线的阶段"""
+    regressions = []
+    for label, base in baseline['stages'].items():
+        result = current['stages'].get(label)
+        if result is None:
+            continue
+        if result['wall_time'] > base['wall_time'] * (1 + tolerance):
+            regressions.append(f"{label}: 耗时 {base['wall_time']:.3f}s -> {result['wall_time']:.3f}s")
+        if 'recall' in base and result.get('recall', 0) < base['recall']:
+            regressions.append(f"{label}: 召回率 {base['recall']:.3f} -> {result['recall']:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档比对性能基准")
+    parser.add_argument('--pages', type=int, default=20, help="每份文档的页数")
+    parser.add_argument('--lines', type=int, default=40, help="每页行数")
+    parser.add_argument('--planted', type=int, default=50, help="植入两份文档的相同行数")
+    parser.add_argument('--images', type=int, default=6, help="植入的相同图片数（另有同样数量的干扰图片）")
+    parser.add_argument('--latin-ratio', type=float, default=0.3, help="英文单词和数字所占的比例")
+    parser.add_argument('--min-length', type=int, default=13, help="最小匹配长度")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子")
+    parser.add_argument('--engines', default='kgram', help="要测的PDF文本比对引擎，逗号分隔")
+    parser.add_argument('--stages', default=','.join(STAGE_NAMES), help="要运行的阶段，逗号分隔")
+    parser.add_argument('--workers', type=int, default=1, help="PDF文本提取的进程数")
+    parser.add_argument('--repeat', type=int, default=3, help="每个阶段重复次数，耗时取最小值")
+    parser.add_argument('--corpus-dir', help="合成语料目录（默认使用临时目录并在结束后删除）")
+    parser.add_argument('--output', help="把本次结果写入该JSON文件")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="基线文件路径")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--check', action='store_true', help="与基线比较，有回归时返回1")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许比基线慢的比例")
+    args = parser.parse_args()
+
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"未知的阶段: {', '.join(sorted(unknown))}")
+    engines = [engine.strip() for engine in args.engines.split(',') if engine.strip()]
+
+    config = {key: getattr(args, key) for key in ('pages', 'lines', 'planted', 'images', 'latin_ratio',
+                                                  'min_length', 'seed', 'workers')}
+    work_dir = args.corpus_dir or tempfile.mkdtemp(prefix='compare_bench_')
+    try:
+        start = time.perf_counter()
+        spec = generate_corpus(work_dir, args.pages, args.lines, args.planted, args.images, args.latin_ratio,
+                               args.min_length, args.seed)
+        print(f"生成语料 {time.perf_counter() - start:.1f}s: {work_dir}")
+        spec.update(work_dir=work_dir, workers=args.workers)
+        stage_results = run_benchmark(spec, stages, engines, args.repeat)
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    current = {
+        'config': config,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'stages': stage_results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=4)
+
+    status = 0
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"基线不存在: {args.baseline}")
+            return 2
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print("基线的语料参数与本次不同，无法比较")
+            return 2
+        regressions = check_regressions(current, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"回归 {regression}")
+        if regressions:
+            status = 1
+        else:
+            print("未发现回归")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=4)
+        print(f"已保存基线: {args.baseline}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,12 +6,23 @@
 
 import os
 import re
+import sys
+import csv
+import time
+import queue
+import bisect
+import hashlib
+import itertools
+import pathlib
+import shutil
+import tempfile
+import subprocess
 import difflib
 import argparse
-from collections import defaultdict
+from collections import defaultdict, deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict,Tuple  
-import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
 
 import webbrowser
 # Word处理依赖
@@ -22,71 +33,70 @@ from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 
 import uuid
+import copy
+from docx.text.run import Run
 # PDF处理依赖
 import fitz  # PyMuPDF
-from reportlab.pdfgen import canvas
-from reportlab.lib.colors import yellow, cyan
 import json
+import zlib
+import sqlite3
+import numpy as np
 from difflib import SequenceMatcher
 import urllib.parse
-from reportlab.lib import colors
 import pdfplumber
 import logging
 import warnings
+from extract_cache import ExtractCache, DEFAULT_CACHE_PATH, file_digest
+from ExtractImageFromPdf import compare_pdf_images, compare_pdf_pages
+from match_index import MatchIndexBuilder, MATCH_INDEX_FILE, read_index
+from text_store import TextStore, DEFAULT_SPILL_MB
+from instrumentation import current_report, start_report, profiled, merge_reports, REPORT_FILE, PROFILE_FILES
 from docx.shared import RGBColor  # 确保正确导入 RGBColor
 # 忽略pdfminer生成的特定警告
 warnings.filterwarnings("ignore", category=UserWarning, message="CropBox missing from /Page, defaulting to MediaBox")
 
 # ================== 通用工具函数 ==================
-def highlight_text(paragraph, start_pos, end_pos, highlight_color=WD_COLOR_INDEX.YELLOW):
-    current_pos = 0
-    runs = list(paragraph.runs)
+def highlight_spans(paragraph, spans):
+    """一次性重写段落的run，为多个区间设置高亮
 
-    for run in runs:
+    spans为按起点排序且互不重叠的[(起点, 终点, 高亮颜色)]，位置以 paragraph.text
+    为准。跨越区间边界的run被拆成多段，每段复制原run的格式；不涉及高亮的run保持不变。
+    """
+    pos = 0
+    for run in list(paragraph.runs):
         run_text = run.text
-        run_length = len(run_text)
-        
-        if current_pos <= start_pos < current_pos + run_length:
-            split_pos_start = start_pos - current_pos
-            split_pos_end = end_pos - current_pos
-            
-            if split_pos_start > 0:
-                new_run = paragraph.add_run(run_text[:split_pos_start])
-                new_run.bold = run.bold
-                new_run.italic = run.italic
-                new_run.font.color.rgb = run.font.color.rgb
-            
-            highlight_run = paragraph.add_run(run_text[split_pos_start:split_pos_end])
-            highlight_run.font.highlight_color = highlight_color
-            highlight_run.bold = run.bold
-            highlight_run.italic = run.italic
-            
-            if split_pos_end < run_length:
-                new_run = paragraph.add_run(run_text[split_pos_end:])
-                new_run.bold = run.bold
-                new_run.italic = run.italic
-                new_run.font.color.rgb = run.font.color.rgb
-            
-            paragraph._p.remove(run._r)
+        run_start, run_end = pos, pos + len(run_text)
+        pos = run_end
+
+        cuts = {0, len(run_text)}
+        for start, end, _ in spans:
+            if start < run_end and end > run_start:
+                cuts.add(max(start, run_start) - run_start)
+                cuts.add(min(end, run_end) - run_start)
+        cuts = sorted(cuts)
+
+        pieces = []
+        for a, b in zip(cuts, cuts[1:]):
+            color = next((c for start, end, c in spans if start <= run_start + a < end), None)
+            pieces.append((run_text[a:b], color))
+        if not any(color for _, color in pieces):
             continue
-        
-        elif current_pos + run_length <= start_pos:
-            new_run = paragraph.add_run(run_text)
-            new_run.bold = run.bold
-            new_run.italic = run.italic
-            new_run.font.color.rgb = run.font.color.rgb
-        
-        else:
-            new_run = paragraph.add_run(run_text)
-            new_run.bold = run.bold
-            new_run.italic = run.italic
-            new_run.font.color.rgb = run.font.color.rgb
-        
-        current_pos += run_length
+
+        for piece_text, color in pieces:
+            new_r = copy.deepcopy(run._r)
+            run._r.addprevious(new_r)
+            new_run = Run(new_r, paragraph)
+            new_run.text = piece_text
+            if color:
+                new_run.font.highlight_color = color
         paragraph._p.remove(run._r)
 
+
 # ================== Word对比模块 ==================
-def compare_docs_with_threshold(doc1_path, doc2_path, min_length=15):
+# 段落末尾最多列出的对方文档位置数
+MAX_LOCATIONS = 10
+
+def compare_docs_with_threshold(doc1_path, doc2_path, min_length=15, cache=None, use_renderer=True):
     """增强版文档对比函数，确保生成完整的位置信息"""
     try:
         doc1 = Document(doc1_path)
@@ -95,27 +105,44 @@ def compare_docs_with_threshold(doc1_path, doc2_path, min_length=15):
         print(f"❌ 无法打开文档: {e}")
         return []
 
+    # 段落 -> (页码, 行号) 对照表，每个文档只计算一次
+    layout1 = get_docx_layout(doc1_path, doc1, cache, use_renderer)
+    layout2 = get_docx_layout(doc2_path, doc2, cache, use_renderer)
+
     matches = []
-    
-    # 段落级对比
-    for i, para1 in enumerate(doc1.paragraphs):
-        for j, para2 in enumerate(doc2.paragraphs):
-            # 新增段落文本清洗
-            text1 = re.sub(r'\s+', '', para1.text)
-            text2 = re.sub(r'\s+', '', para2.text)
-            
-            if text1 == text2 and len(text1) >= min_length:
-              
+
+    # 每个段落只清洗一次（python-docx 每次访问 paragraphs 都会重新构建列表，也只取一次）
+    paragraphs1 = doc1.paragraphs
+    paragraphs2 = doc2.paragraphs
+    texts1 = [re.sub(r'\s+', '', para.text) for para in paragraphs1]
+    texts2 = [re.sub(r'\s+', '', para.text) for para in paragraphs2]
+
+    # 完全相同的段落用哈希表直接查找
+    exact_index = defaultdict(set)
+    for j, text2 in enumerate(texts2):
+        if len(text2) >= min_length:
+            exact_index[text2].add(j)
+
+    # 段落级对比：只有共享k-gram的段落对才可能存在长度不小于min_length的公共部分
+    for i, candidates in find_candidate_pairs(texts1, texts2, min_length):
+        para1 = paragraphs1[i]
+        text1 = texts1[i]
+        full_matches = exact_index.get(text1, ())
+        for j in candidates:
+            para2 = paragraphs2[j]
+            text2 = texts2[j]
+
+            if j in full_matches:
                 matches.append({
                     "type": "full_match",
                     "doc1_para": i,
                     "doc1_pos": (0, len(para1.text)),  # 新增全段落位置
-                    "doc1_page": get_page_number(doc1, i),
-                    "doc1_line": get_line_number(doc1, i),
+                    "doc1_page": get_page_number(layout1, i),
+                    "doc1_line": get_line_number(layout1, i),
                     "doc2_para": j,
                     "doc2_pos": (0, len(para2.text)),
-                    "doc2_page": get_page_number(doc2, j),
-                    "doc2_line": get_line_number(doc2, j)
+                    "doc2_page": get_page_number(layout2, j),
+                    "doc2_line": get_line_number(layout2, j)
                 })
             else:
                 # 使用改进的LCS算法进行局部匹配
@@ -126,24 +153,161 @@ def compare_docs_with_threshold(doc1_path, doc2_path, min_length=15):
                             "type": "partial_match",
                             "doc1_para": i,
                             "doc1_pos": (match.a, match.a + match.size),
-                            "doc1_page": get_page_number(doc1, i),
-                            "doc1_line": get_line_number(doc1, i),
+                            "doc1_page": get_page_number(layout1, i),
+                            "doc1_line": get_line_number(layout1, i),
                             "doc2_para": j,
                             "doc2_pos": (match.b, match.b + match.size),
-                            "doc2_page": get_page_number(doc2, j),
-                            "doc2_line": get_line_number(doc2, j)
+                            "doc2_page": get_page_number(layout2, j),
+                            "doc2_line": get_line_number(layout2, j)
                         })
     return matches
 
-def get_page_number(doc, para_index):
-    """获取段落在文档中的页码"""
-    # 这里假设每个段落都在新的一页，实际情况可能需要更复杂的逻辑
-    return para_index // 50 + 1  # 假设每页最多50个段落
+def get_page_number(layout, para_index):
+    """获取段落在文档中的页码，layout 为 get_docx_layout 返回的对照表"""
+    return layout[para_index][0]
+
+def get_line_number(layout, para_index):
+    """获取段落首行在所在页中的行号"""
+    return layout[para_index][1]
+
+
+# ------------------ DOCX 版面：段落 -> (页码, 行号) ------------------
+DOCX_LAYOUT_VERSION = 1
+CHARS_PER_LINE = 40     # 无法渲染时估算每行字数（A4、默认页边距、五号字）
+RENDER_TIMEOUT = 120    # 渲染单个文档的超时时间（秒）
+ALIGN_PREFIX = 20       # 在渲染结果中定位段落时使用的段首字数
+ALIGN_WINDOW = 5000     # 定位段落时向后搜索的最大字数
+
+
+def find_docx_renderer():
+    """本机可用的无界面渲染器（LibreOffice），没有时返回None"""
+    return shutil.which('soffice') or shutil.which('libreoffice')
+
+
+def render_docx_to_pdf(doc_path, output_dir):
+    """用LibreOffice把DOCX转换为PDF，失败时返回None
+
+    每次转换使用output_dir下独立的用户配置目录：共用默认配置的多个soffice进程（批量 -j N）
+    会把任务转交给已在运行的实例或直接退出，不写出PDF。
+    """
+    renderer = find_docx_renderer()
+    if not renderer:
+        return None
+    profile_url = pathlib.Path(os.path.abspath(os.path.join(output_dir, 'lo_profile'))).as_uri()
+    try:
+        subprocess.run([renderer, f'-env:UserInstallation={profile_url}', '--headless', '--convert-to', 'pdf',
+                        '--outdir', output_dir, doc_path],
+                       check=True, timeout=RENDER_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning("渲染 %s 失败，改用分页标记估算版面: %s", doc_path, e)
+        return None
+    pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(doc_path))[0] + '.pdf')
+    return pdf_path if os.path.exists(pdf_path) else None
+
+
+def layout_from_rendered_pdf(doc, pdf_path):
+    """按渲染出的PDF定位每个段落：在PDF文本流中顺序查找段首文字，取其所在的页与行"""
+    stream = []
+    positions = []
+    for record in iter_page_range(pdf_path, 0, get_pdf_page_count(pdf_path), 1, 'pymupdf'):
+        for ch in re.sub(r'\s+', '', record['text']):
+            stream.append(ch)
+            positions.append((record['page'], record['line']))
+    stream = ''.join(stream)
+    if not stream:
+        return layout_from_page_breaks(doc)
+
+    layout = []
+    cursor = 0
+    for paragraph in doc.paragraphs:
+        key = re.sub(r'\s+', '', paragraph.text)[:ALIGN_PREFIX]
+        found = stream.find(key, cursor, cursor + len(key) + ALIGN_WINDOW) if key else -1
+        if found >= 0:
+            layout.append(positions[found])
+            cursor = found + len(key)
+        else:
+            # 空段落或找不到（如域代码、编号差异）时沿用当前位置
+            layout.append(positions[min(cursor, len(positions) - 1)])
+    return layout
+
+
+def layout_from_page_breaks(doc):
+    """根据文档XML中的分页标记估算每个段落的(页码, 行号)
+
+    识别 w:br type="page"、Word保存时写入的 w:lastRenderedPageBreak、段前分页
+    w:pageBreakBefore 以及分节符；段落占用的行数按 CHARS_PER_LINE 估算。
+    """
+    tag_text = qn('w:t')
+    tag_break = qn('w:br')
+    tag_rendered_break = qn('w:lastRenderedPageBreak')
 
-def get_line_number(doc, para_index):
-    """获取段落在文档中的行号"""
-    # 这里假设每个段落都在新的一行，实际情况可能需要更复杂的逻辑
-    return para_index % 50 + 1  # 假设每页最多50个段落
+    def is_on(element):
+        return element is not None and element.get(qn('w:val')) not in ('0', 'false', 'off')
+
+    layout = []
+    page, line, chars_on_page = 1, 1, 0
+    pending_section_break = False
+
+    for paragraph in doc.paragraphs:
+        p = paragraph._p
+        pPr = p.pPr
+        # 段前分页与上一段的分节符：当前页已有内容时才换页
+        if (pending_section_break or (pPr is not None and is_on(pPr.find(qn('w:pageBreakBefore'))))) and chars_on_page:
+            page, line, chars_on_page = page + 1, 1, 0
+
+        location = None
+        segment = 0
+        ended_with_break = False
+        for element in p.iter(tag_text, tag_break, tag_rendered_break):
+            if element.tag == tag_text:
+                if element.text:
+                    if location is None:
+                        location = (page, line)
+                    segment += len(element.text)
+                    chars_on_page += len(element.text)
+                    ended_with_break = False
+            elif element.tag == tag_rendered_break:
+                # 上次渲染时在此处换页；刚换过页时（如紧跟在分页符之后）不重复计算
+                if chars_on_page:
+                    page, line, chars_on_page = page + 1, 1, 0
+                    segment = 0
+                    ended_with_break = True
+            elif element.get(qn('w:type')) == 'page':
+                page, line, chars_on_page = page + 1, 1, 0
+                segment = 0
+                ended_with_break = True
+
+        layout.append(location or (page, line))
+        if not ended_with_break:
+            line += max(1, -(-segment // CHARS_PER_LINE))
+
+        sectPr = pPr.find(qn('w:sectPr')) if pPr is not None else None
+        section_type = sectPr.find(qn('w:type')) if sectPr is not None else None
+        pending_section_break = sectPr is not None and (
+            section_type is None or section_type.get(qn('w:val')) != 'continuous')
+    return layout
+
+
+def get_docx_layout(doc_path, doc=None, cache=None, use_renderer=True):
+    """计算段落 -> [页码, 行号] 对照表，下标与 doc.paragraphs 一致
+
+    有LibreOffice时渲染为PDF后按实际版面定位，否则按分页标记估算；传入cache时
+    以文件内容为键缓存结果，查表为O(1)。
+    """
+    use_renderer = bool(use_renderer and find_docx_renderer())
+
+    def compute():
+        document = doc if doc is not None else Document(doc_path)
+        if use_renderer:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                pdf_path = render_docx_to_pdf(doc_path, tmp_dir)
+                if pdf_path:
+                    return [list(location) for location in layout_from_rendered_pdf(document, pdf_path)]
+        return [list(location) for location in layout_from_page_breaks(document)]
+
+    if cache is None:
+        return compute()
+    return cache.get_or_extract('layout', doc_path, DOCX_LAYOUT_VERSION, {'renderer': use_renderer}, compute)
 
 def add_comment(paragraph, comment_text):
     """在段落后添加注释"""
@@ -252,89 +416,610 @@ def extract_page_numbers(doc):
     return page_numbers
 
 
-def mark_common_text_in_word(doc1_path, doc2_path, output1_path, output2_path, min_length=15):
-    matches = compare_docs_with_threshold(doc1_path, doc2_path, min_length)
-    
-    # 新增处理状态追踪字典
-    doc1_processed = defaultdict(set)
-    doc2_processed = defaultdict(set)
+def merge_spans(spans):
+    """合并重叠或相邻的[起点, 终点)区间，返回按起点排序的区间列表"""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(span) for span in merged]
 
 
-     # 读取页码编号
-    doc1 = Document(doc1_path)
-    doc2 = Document(doc2_path)
-    page_numbers1 = extract_page_numbers(doc1)
-    page_numbers2 = extract_page_numbers(doc2)
-    
+def map_stripped_spans(text, spans):
+    """把去除空白后文本上的区间映射回原段落文本上的区间"""
+    positions = [m.start() for m in re.finditer(r'\S', text)]
+    mapped = []
+    for start, end in spans:
+        if start < end <= len(positions):
+            mapped.append((positions[start], positions[end - 1] + 1))
+    return mapped
 
 
-    # 处理文档1（仅处理未被处理过的段落）
-    try:
-        doc1 = Document(doc1_path)
-        for match in matches:
-            para_idx = match["doc1_para"]
-            start, end = match["doc1_pos"]
+def annotate_document(doc_path, output_path, matches, side, other_side, add_comments=False):
+    """在一个Word文档中标注所有匹配，每个段落只重写一次run，文档只保存一次
 
-            
-            # 跳过已处理段落
-            if para_idx in doc1_processed:
-                continue
-             # 确保索引有效
-            if para_idx < len(doc1.paragraphs):
-                if match["type"] == "full_match":
-                    highlight_text(doc1.paragraphs[para_idx], 0, len(doc1.paragraphs[para_idx].text), WD_COLOR_INDEX.TURQUOISE)
-                    doc1_processed[para_idx].add("full")  # 标记为已处理
-                    #add_comment(doc1.paragraphs[para_idx], f"匹配于{doc2_path}文档第{match[page_numbers2]}页, 第{match['doc2_line']}行")
-                    bookmark_name = f"Bk_{uuid.uuid4().hex[:4]}"  # 缩短书签名称
-                    add_bookmark(doc1.paragraphs[para_idx], bookmark_name, position=end, additional_text=f"     第{match['doc2_page']}页, 第{match['doc2_line']}行")
-
-                elif match["type"] == "partial_match" and "full" not in doc1_processed[para_idx]:
-                    highlight_text(doc1.paragraphs[para_idx], start, end, WD_COLOR_INDEX.YELLOW)
-                    doc1_processed[para_idx].add("partial")
-                    #add_comment(doc1.paragraphs[para_idx], f"部分匹配于{doc2_path}文档第{page_numbers2}页, 第{match['doc2_line']}行")
-                    bookmark_name = f"Bk_{uuid.uuid4().hex[:4]}"  # 缩短书签名称
-                    add_bookmark(doc1.paragraphs[para_idx], bookmark_name, position=end, additional_text=f"     第{match['doc2_page']}页, 第{match['doc2_line']}行")
-            doc1.save(output1_path)
+    side为本文档在匹配记录中的前缀('doc1'/'doc2')，other_side为对方文档前缀，
+    段落末尾追加对方文档中的位置；完全匹配的段落整段标青色，否则合并所有部分
+    匹配区间后标黄色。
+    """
+    doc = Document(doc_path)
+    paragraphs = doc.paragraphs
+
+    matches_by_para = defaultdict(list)
+    for match in matches:
+        matches_by_para[match[f"{side}_para"]].append(match)
+
+    for para_idx in sorted(matches_by_para):
+        # 确保索引有效
+        if para_idx >= len(paragraphs):
+            continue
+        paragraph = paragraphs[para_idx]
+        para_matches = matches_by_para[para_idx]
+
+        full = any(match["type"] == "full_match" for match in para_matches)
+        if full:
+            highlight_spans(paragraph, [(0, len(paragraph.text), WD_COLOR_INDEX.TURQUOISE)])
+        else:
+            spans = merge_spans(map_stripped_spans(paragraph.text, [match[f"{side}_pos"] for match in para_matches]))
+            highlight_spans(paragraph, [(start, end, WD_COLOR_INDEX.YELLOW) for start, end in spans])
+
+        locations = list(dict.fromkeys(
+            f"第{match[f'{other_side}_page']}页, 第{match[f'{other_side}_line']}行" for match in para_matches
+        ))
+        location_text = "；".join(locations[:MAX_LOCATIONS])
+        if len(locations) > MAX_LOCATIONS:
+            location_text += f" 等{len(locations)}处"
+
+        if add_comments:
+            add_comment(paragraph, f"{'完全' if full else '部分'}匹配于文档1{location_text}")
+        bookmark_name = f"Bk_{uuid.uuid4().hex[:4]}"  # 缩短书签名称
+        add_bookmark(paragraph, bookmark_name, additional_text=f"     {location_text}")
+
+    doc.save(output_path)
+
+
+def mark_common_text_in_word(doc1_path, doc2_path, output1_path, output2_path, min_length=15, cache=None):
+    report = current_report()
+    with report.stage('docx_compare'):
+        matches = compare_docs_with_threshold(doc1_path, doc2_path, min_length, cache)
+    report.count('docx_compare', matches=len(matches))
+
+    # 处理文档1
+    try:
+        with report.stage('docx_annotate'):
+            annotate_document(doc1_path, output1_path, matches, "doc1", "doc2")
     except Exception as e:
         print(f"❌ 处理文档1失败: {e}")
 
-    # 处理文档2（逻辑同上）
+    # 处理文档2（逻辑同上，并添加注释）
     try:
-        doc2 = Document(doc2_path)
-        for match in matches:
-            para_idx = match["doc2_para"]
-            start, end = match["doc2_pos"]
-             # 打印调试信息
-            
-            if para_idx in doc2_processed:
-                continue
-              # 确保索引有效
-               
-            if para_idx < len(doc2.paragraphs):
-              
-                if match["type"] == "full_match":
-                    highlight_text(doc2.paragraphs[para_idx], 0, len(doc2.paragraphs[para_idx].text), WD_COLOR_INDEX.TURQUOISE)
-                    doc2_processed[para_idx].add("full")
-                    add_comment(doc2.paragraphs[para_idx], f"完全匹配于文档1第{match['doc1_page']}页, 第{match['doc1_line']}行")
-                    bookmark_name = f"Bk_{uuid.uuid4().hex[:4]}"  # 缩短书签名称
-                    add_bookmark(doc2.paragraphs[para_idx], bookmark_name, position=end, additional_text=f"    第{match['doc1_page']}页, 第{match['doc1_line']}行")
-                elif match["type"] == "partial_match" and "full" not in doc2_processed[para_idx]:
-                    highlight_text(doc2.paragraphs[para_idx], start, end, WD_COLOR_INDEX.YELLOW)
-                    doc2_processed[para_idx].add("partial")
-                    add_comment(doc2.paragraphs[para_idx], f"部分匹配于文档1第{match['doc1_page']}页, 第{match['doc1_line']}行")
-                    bookmark_name = f"Bk_{uuid.uuid4().hex[:4]}"  # 缩短书签名称
-                    add_bookmark(doc2.paragraphs[para_idx], bookmark_name, position=end, additional_text=f"    第{match['doc1_page']}页, 第{match['doc1_line']}行")
-            doc2.save(output2_path)
+        with report.stage('docx_annotate'):
+            annotate_document(doc2_path, output2_path, matches, "doc2", "doc1", add_comments=True)
     except Exception as e:
         print(f"❌ 处理文档2失败: {e}")
 
+    return len(matches)
+
 # ------------------ 日志配置 ------------------
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("PDFComparator")
 
 # ================== PDF对比模块 ==================
 
-def compare_pdfs(file1, file2, output_dir, min_length):
+def iter_page_range_pdfplumber(file_path, start, end, min_length):
+    """pdfplumber后端：逐页产出第start页到第end页(不含，从0开始计)的文本行"""
+    with pdfplumber.open(file_path) as pdf:
+        for page_index in range(start, min(end, len(pdf.pages))):
+            page = pdf.pages[page_index]
+            text = page.extract_text()
+            # pdfplumber会在页对象上缓存解析出的字符和版面对象，处理完立即释放
+            page.close()
+            if text:
+                lines = text.split('\n')  # 按行分割文本
+                for line_number, line in enumerate(lines, start=1):
+                    if len(line) >= min_length:
+                        yield {
+                            'page': page_index + 1,
+                            'line': line_number,
+                            'text': line
+                        }
+
+
+# 只要文字：去掉默认标志中的TEXT_PRESERVE_IMAGES，其余与get_text("dict")的默认值一致
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def iter_page_range_pymupdf(file_path, start, end, min_length):
+    """PyMuPDF后端：按版面顺序逐页产出文本行，并附带行的包围盒(左上角为原点，单位pt)"""
+    with fitz.open(file_path) as pdf_document:
+        for page_index in range(start, min(end, len(pdf_document))):
+            page = pdf_document.load_page(page_index)
+            line_number = 0
+            # 默认标志会解码页面上的每张图片并放进结果，扫描件上比提取文字本身慢得多
+            for block in page.get_text("dict", flags=TEXT_DICT_FLAGS, sort=True)["blocks"]:
+                if block["type"] != 0:  # 跳过图片块
+                    continue
+                for line in block["lines"]:
+                    text = ''.join(span["text"] for span in line["spans"])
+                    if not text.strip():
+                        continue
+                    line_number += 1
+                    if len(text) >= min_length:
+                        yield {
+                            'page': page_index + 1,
+                            'line': line_number,
+                            'text': text,
+                            'bbox': [round(v, 2) for v in line["bbox"]]
+                        }
+
+
+# PDF文本比对引擎
+TEXT_ENGINES = ('kgram', 'suffix', 'minhash')
+
+# 比对结果的输出格式 -> 文件名
+OUTPUT_FILES = {
+    'json': 'CommonParagraphs.json',
+    'ndjson': 'CommonParagraphs.ndjson',
+}
+NDJSON_VERSION = 1
+
+# Flask静态目录：showpdf.html通过其中的paths.txt找到两个PDF（相对该目录的路径）
+VIEWER_STATIC_DIR = 'static'
+
+# 提取逻辑或输出格式变化时递增，使旧的缓存条目失效
+TEXT_EXTRACTOR_VERSION = 1
+
+# 文本提取后端：名称 -> 按页码区间逐页产出文本行的生成器函数
+EXTRACTION_BACKENDS = {
+    'pymupdf': iter_page_range_pymupdf,
+    'pdfplumber': iter_page_range_pdfplumber,
+}
+
+# 流式提取时每个分片的最大页数，限制进程池中已完成但尚未消费的结果
+STREAM_CHUNK_PAGES = 16
+
+
+def iter_page_range(file_path, start, end, min_length, backend='pymupdf'):
+    """用指定后端逐页产出PDF第start页到第end页(不含)的文本行"""
+    if backend not in EXTRACTION_BACKENDS:
+        raise ValueError(f"不支持的提取后端: {backend}")
+    return EXTRACTION_BACKENDS[backend](file_path, start, end, min_length)
+
+
+def extract_page_range(file_path, start, end, min_length, backend='pymupdf'):
+    """提取PDF第start页到第end页(不含)的文本行列表，也用作进程池的任务"""
+    return list(iter_page_range(file_path, start, end, min_length, backend))
+
+
+def extract_paragraphs(file_path, min_length, backend='pymupdf'):
+    """串行提取整个PDF的文本行"""
+    return extract_page_range(file_path, 0, get_pdf_page_count(file_path), min_length, backend)
+
+
+def get_pdf_page_count(file_path):
+    with fitz.open(file_path) as pdf_document:
+        return len(pdf_document)
+
+
+def split_page_ranges(page_count, workers, max_pages=None):
+    """把页码切成若干[start, end)区间，分片数取进程数的4倍以便负载均衡，每片不超过max_pages页"""
+    chunk = max(1, -(-page_count // (workers * 4)))
+    if max_pages is not None:
+        chunk = min(chunk, max_pages)
+    return [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+
+
+def iter_paragraphs(file_path, min_length, backend='pymupdf', executor=None, workers=1):
+    """逐页产出整个PDF的文本行，不在内存中累积
+
+    传入进程池executor时按页码区间分片并行提取，同时提交的分片不超过2 * workers个，
+    按页码顺序产出，每个分片产出后即释放，内存占用与页数无关。
+    """
+    page_count = get_pdf_page_count(file_path)
+    if executor is None:
+        yield from iter_page_range(file_path, 0, page_count, min_length, backend)
+        return
+
+    ranges = iter(split_page_ranges(page_count, workers, STREAM_CHUNK_PAGES))
+    pending = deque(executor.submit(extract_page_range, file_path, start, end, min_length, backend)
+                    for start, end in itertools.islice(ranges, 2 * workers))
+    while pending:
+        paragraphs = pending.popleft().result()
+        next_range = next(ranges, None)
+        if next_range is not None:
+            pending.append(executor.submit(extract_page_range, file_path, *next_range, min_length, backend))
+        yield from paragraphs
+
+
+def extract_paragraphs_parallel(file_paths, min_length, workers=1, backend='pymupdf'):
+    """并行提取多个PDF的文本行，返回与file_paths顺序一致的行列表
+
+    每个文件按页码区间分片，所有文件的分片提交到同一个进程池，每个子进程
+    自己打开文件处理一个区间，最后按分片顺序拼接，结果与串行提取完全一致。
+    """
+    if workers <= 1:
+        return [extract_paragraphs(path, min_length, backend) for path in file_paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            [executor.submit(extract_page_range, path, start, end, min_length, backend)
+             for start, end in split_page_ranges(get_pdf_page_count(path), workers)]
+            for path in file_paths
+        ]
+        results = []
+        for file_futures in futures:
+            paragraphs = []
+            for future in file_futures:
+                paragraphs.extend(future.result())
+            results.append(paragraphs)
+    return results
+
+
+def extract_paragraphs_cached(file_paths, min_length, workers=1, backend='pymupdf', cache=None):
+    """带缓存的文本提取：命中缓存的文件直接复用，其余文件并行提取后写入缓存"""
+    if cache is None:
+        return extract_paragraphs_parallel(file_paths, min_length, workers, backend)
+
+    options = {'backend': backend, 'min_length': min_length}
+    keys = []
+    results = []
+    for path in file_paths:
+        digest = file_digest(path)
+        key = cache.make_key('text', digest, TEXT_EXTRACTOR_VERSION, options)
+        keys.append((key, digest))
+        results.append(cache.get(key))
+
+    missing = [idx for idx, paragraphs in enumerate(results) if paragraphs is None]
+    if missing:
+        extracted = extract_paragraphs_parallel([file_paths[idx] for idx in missing], min_length, workers, backend)
+        for idx, paragraphs in zip(missing, extracted):
+            key, digest = keys[idx]
+            cache.put(key, 'text', digest, paragraphs, source=os.path.abspath(file_paths[idx]))
+            results[idx] = paragraphs
+    return results
+
+
+def spill_limit(spill_mb):
+    """--spill-mb换算为TextStore的spill_bytes，0表示不限制"""
+    return int(spill_mb * 1024 * 1024) if spill_mb else None
+
+
+def extract_text_stores(file_paths, min_length, workers=1, backend='pymupdf', cache=None,
+                        spill_mb=DEFAULT_SPILL_MB):
+    """流式提取多个PDF，返回与file_paths顺序一致的TextStore
+
+    文本行从缓存或提取过程逐页产出，直接写入TextStore（未命中缓存时同时逐行写入缓存），
+    不生成整个文档的行列表；原文超过spill_mb后移到临时文件，spill_mb为0时不限制。
+    """
+    spill_bytes = spill_limit(spill_mb)
+    options = {'backend': backend, 'min_length': min_length}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        stores = []
+        for path in file_paths:
+            paragraphs = None
+            if cache is not None:
+                digest = file_digest(path)
+                key = cache.make_key('text', digest, TEXT_EXTRACTOR_VERSION, options)
+                paragraphs = cache.get_items(key)
+            if paragraphs is None:
+                paragraphs = iter_paragraphs(path, min_length, backend, executor, workers)
+                if cache is not None:
+                    paragraphs = cache.record_items(key, 'text', digest, paragraphs, source=os.path.abspath(path))
+            stores.append(TextStore(paragraphs, spill_bytes))
+        return stores
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+# ------------------ 增量比对 ------------------
+# 每次比对在输出目录中保存页面清单：每页内容流的摘要(raw)和提取出的文本行的摘要(text)。
+# 再次比对同一输出目录时，内容流未变的页直接沿用上次的文本行；内容流变化的页重新提取，
+# 文本行仍相同的页同样视为未变。两边都未变的行对沿用上次的匹配，只重新比对涉及变化行的行对。
+PAGE_MANIFEST_FILE = 'CommonParagraphs.pages.json'
+PAGE_MANIFEST_VERSION = 1
+
+
+def page_raw_fingerprints(file_path):
+    """每页内容流、表单XObject和字体的摘要，不提取文本即可判断页面是否可能变化"""
+    fingerprints = []
+    with fitz.open(file_path) as pdf_document:
+        for page in pdf_document:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(repr(tuple(page.rect)).encode('utf-8'))
+            digest.update(page.read_contents())
+            for xref, *_ in page.get_xobjects():
+                digest.update(pdf_document.xref_stream(xref) or b'')
+            for font in page.get_fonts():
+                digest.update(repr(font[1:]).encode('utf-8'))  # 不含xref，重新生成的文件xref会变
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def page_text_hash(page_paragraphs):
+    lines = [(para['line'], para['text']) for para in page_paragraphs]
+    return hashlib.blake2b(json.dumps(lines, ensure_ascii=False).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def group_by_page(paragraphs, page_count):
+    """按页分组：返回长度为page_count的列表，第p项为第p+1页的行"""
+    pages = [[] for _ in range(page_count)]
+    for para in paragraphs:
+        pages[para['page'] - 1].append(para)
+    return pages
+
+
+def page_manifest(file_path, paragraphs, raw=None):
+    """一个文档的页面清单"""
+    raw = page_raw_fingerprints(file_path) if raw is None else raw
+    return {
+        'file': file_path,
+        'raw': raw,
+        'text': [page_text_hash(page) for page in group_by_page(paragraphs, len(raw))],
+    }
+
+
+def load_previous_run(output_dir, settings):
+    """读取上一次比对的页面清单和匹配索引，设置不同或文件不完整时返回None"""
+    manifest_path = os.path.join(output_dir, PAGE_MANIFEST_FILE)
+    index_path = os.path.join(output_dir, MATCH_INDEX_FILE)
+    if not (os.path.exists(manifest_path) and os.path.exists(index_path)):
+        return None
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != PAGE_MANIFEST_VERSION or manifest.get('settings') != settings:
+            return None
+        paragraphs1, paragraphs2, matches, info = read_index(index_path)
+    except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+        logger.warning("无法读取上一次的比对结果，改为完整比对: %s", e)
+        return None
+    # 索引与清单来自同一次比对才能拼接
+    if info['matches'] != manifest['matches']:
+        return None
+    return {'docs': manifest['docs'], 'paragraphs': [paragraphs1, paragraphs2], 'matches': matches}
+
+
+def plan_incremental_pages(file_path, previous_doc, previous_paragraphs, min_length, backend):
+    """对照上一次的页面清单确定哪些页变化了
+
+    返回 (新的文本行, {旧行下标: 新行下标}, 变化页上的新行下标集合, 页面清单, 重新提取的页数, 变化的页数)。
+    页面按内容摘要对应，插入或删除页导致的页码整体移动不会使其余页被当作变化。
+    """
+    raw = page_raw_fingerprints(file_path)
+    old_pages = [[] for _ in previous_doc['raw']]
+    for idx, para in enumerate(previous_paragraphs):
+        old_pages[para['page'] - 1].append(idx)
+
+    old_by_raw = defaultdict(list)
+    old_by_text = defaultdict(list)
+    for q, (raw_hash, text_hash) in enumerate(zip(previous_doc['raw'], previous_doc['text'])):
+        old_by_raw[raw_hash].append(q)
+        old_by_text[text_hash].append(q)
+    used = set()
+
+    def take(candidates):
+        while candidates:
+            q = candidates.pop(0)
+            if q not in used:
+                used.add(q)
+                return q
+        return None
+
+    # 第一轮：内容流相同的页直接沿用旧页
+    source = [take(old_by_raw[raw_hash]) for raw_hash in raw]
+
+    # 第二轮：其余页按连续区间重新提取，文本行与某个旧页相同时仍视为未变
+    extracted = {}
+    missing = [p for p, q in enumerate(source) if q is None]
+    start = 0
+    while start < len(missing):
+        end = start
+        while end + 1 < len(missing) and missing[end + 1] == missing[end] + 1:
+            end += 1
+        page_lines = extract_page_range(file_path, missing[start], missing[end] + 1, min_length, backend)
+        for p in range(missing[start], missing[end] + 1):
+            extracted[p] = []
+        for para in page_lines:
+            extracted[para['page'] - 1].append(para)
+        start = end + 1
+
+    paragraphs = []
+    line_map = {}
+    changed = set()
+    text_hashes = []
+    changed_pages = 0
+    for p, q in enumerate(source):
+        if q is not None:
+            page_lines = [dict(previous_paragraphs[idx], page=p + 1) for idx in old_pages[q]]
+            text_hash = previous_doc['text'][q]
+        else:
+            page_lines = extracted[p]
+            text_hash = page_text_hash(page_lines)
+            q = take(old_by_text[text_hash])
+        first = len(paragraphs)
+        paragraphs.extend(page_lines)
+        text_hashes.append(text_hash)
+        if q is None:
+            changed.update(range(first, len(paragraphs)))
+            changed_pages += 1
+        else:
+            # 文本行完全相同，旧页的第k行对应新页的第k行
+            line_map.update(zip(old_pages[q], range(first, len(paragraphs))))
+
+    manifest = {'file': file_path, 'raw': raw, 'text': text_hashes}
+    return paragraphs, line_map, changed, manifest, len(missing), changed_pages
+
+
+def incremental_line_matches(store1, store2, changed1, changed2, kept, min_length):
+    """沿用未变行对的旧记录kept，只比对至少一行变化的行对；结果与完整比对的顺序相同"""
+    records = list(kept)
+    if changed1:
+        records.extend(coalesce_line_matches(
+            kgram_line_matches(store1, store2, min_length, rows1=sorted(changed1)), store1))
+    if changed2:
+        unchanged_rows = [i for i in range(len(store1)) if i not in changed1]
+        records.extend(coalesce_line_matches(
+            kgram_line_matches(store1, store2, min_length, rows1=unchanged_rows, rows2=sorted(changed2)), store1))
+
+    # 完整比对按(行1, 行2)顺序产出，每个行对一条记录，要么沿用要么重算
+    records.sort(key=lambda record: (record[0], record[1]))
+    return records
+
+
+def write_page_manifest(output_dir, settings, docs, match_count):
+    manifest = {'version': PAGE_MANIFEST_VERSION, 'settings': settings, 'matches': match_count, 'docs': docs}
+    with open(os.path.join(output_dir, PAGE_MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def coalesce_spans(spans):
+    """合并一个行对上的匹配区间spans = [(行1起点, 行2起点, 长度)]
+
+    同一对角线（行2起点 - 行1起点相同）上的区间按起点排序，重叠或相邻的合并为极大区间；
+    再按行1上的起点升序、终点降序扫描，终点不超过已扫描最大终点的区间被其他区间包含，丢弃。
+    返回按行1起点排序的区间。
+    """
+    by_diagonal = defaultdict(list)
+    for a, b, size in spans:
+        by_diagonal[b - a].append((a, a + size))
+    regions = []
+    for diagonal, intervals in by_diagonal.items():
+        intervals.sort()
+        start, end = intervals[0]
+        for next_start, next_end in intervals[1:]:
+            if next_start <= end:
+                end = max(end, next_end)
+            else:
+                regions.append((start, end, diagonal))
+                start, end = next_start, next_end
+        regions.append((start, end, diagonal))
+
+    regions.sort(key=lambda region: (region[0], -region[1]))
+    coalesced = []
+    reach = -1
+    for start, end, diagonal in regions:
+        if end > reach:
+            coalesced.append((start, start + diagonal, end - start))
+            reach = end
+    return coalesced
+
+
+def coalesce_line_matches(line_matches, store1):
+    """把(行1下标, 行2下标, 行1起点, 行2起点, 长度)形式的匹配合并为每个行对一条记录(i, j, [公共子串])
+
+    各引擎按行对顺序产出匹配，同一行对的匹配相邻，只需缓存当前行对的区间；
+    行对内重叠、相邻的区间合并，被包含的区间和重复的子串丢弃。
+    """
+    for (i, j), spans in itertools.groupby(line_matches, key=lambda match: (match[0], match[1])):
+        text1 = store1.clean(i)
+        substrings = [text1[a:a + size] for a, _, size in coalesce_spans(match[2:] for match in spans)]
+        yield i, j, list(dict.fromkeys(substrings))
+
+
+def make_common_record(file1, file2, para1, para2, substrings):
+    """CommonParagraphs.json 中 common_paragraphs 的一条记录"""
+    record = {
+        'file1': file1,
+        'page1': para1['page'],
+        'line1': para1['line'],
+        'text1': para1['text'],
+        'file2': file2,
+        'page2': para2['page'],
+        'line2': para2['line'],
+        'text2': para2['text'],
+        'common_substrings': substrings
+    }
+    # PyMuPDF后端提供行包围盒，showpdf.html据此直接框选匹配行
+    if 'bbox' in para1:
+        record['bbox1'] = para1['bbox']
+    if 'bbox' in para2:
+        record['bbox2'] = para2['bbox']
+    return record
+
+
+def write_json_array(f, items, indent='    '):
+    """逐个元素写出JSON数组，返回写出的元素个数"""
+    count = 0
+    f.write('[')
+    for item in items:
+        f.write(',\n' if count else '\n')
+        f.write(indent + '    ' + json.dumps(item, ensure_ascii=False))
+        count += 1
+    f.write(f'\n{indent}]' if count else ']')
+    return count
+
+
+def write_json_result(output_file, file1, file2, paragraphs1, paragraphs2, matches, extra=None):
+    """兼容格式：结构与原来的 CommonParagraphs.json 相同，匹配记录逐条写出"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('{\n    "paragraphs1": ')
+        write_json_array(f, paragraphs1)
+        f.write(',\n    "paragraphs2": ')
+        write_json_array(f, paragraphs2)
+        f.write(',\n    "common_paragraphs": ')
+        count = write_json_array(f, (make_common_record(file1, file2, paragraphs1[i], paragraphs2[j], substrings)
+                                     for i, j, substrings in matches))
+        for key, value in (extra or {}).items():
+            f.write(f',\n    {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+        f.write('\n}\n')
+    return count
+
+
+def write_ndjson_result(output_file, file1, file2, paragraphs1, paragraphs2, matches, extra=None):
+    """规范化的NDJSON格式，每行一个对象，按以下顺序写出：
+
+    {"type": "header", "version": 1, "file1": ..., "file2": ...}
+    {"type": "line", "doc": 1或2, "id": 行下标, "page": ..., "line": ..., "text": ..., ["bbox": ...]}
+    {"type": "match", "line1": 文档1行下标, "line2": 文档2行下标, "common_substrings": [...]}，每个行对一条
+    {"type": 附加信息名, ...}，例如 screening
+    {"type": "end", "matches": 匹配条数}
+
+    匹配只引用行下标而不重复文本，showpdf.html可以边下载边解析。
+    """
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        def emit(obj):
+            f.write(json.dumps(obj, ensure_ascii=False))
+            f.write('\n')
+
+        emit({'type': 'header', 'version': NDJSON_VERSION, 'file1': file1, 'file2': file2})
+        for doc, paragraphs in ((1, paragraphs1), (2, paragraphs2)):
+            for idx, para in enumerate(paragraphs):
+                emit({'type': 'line', 'doc': doc, 'id': idx, **para})
+        for i, j, substrings in matches:
+            emit({'type': 'match', 'line1': i, 'line2': j, 'common_substrings': substrings})
+            count += 1
+        for key, value in (extra or {}).items():
+            emit({'type': key, **value})
+        emit({'type': 'end', 'matches': count})
+    return count
+
+
+def write_viewer_paths(file1, file2, static_dir=VIEWER_STATIC_DIR):
+    """把两个PDF相对静态目录的URL路径写入paths.txt，无法表示为相对路径时跳过"""
+    base_path = os.path.abspath(static_dir)
+    try:
+        rel_paths = [os.path.relpath(os.path.abspath(path), base_path).replace(os.sep, '/') for path in (file1, file2)]
+    except ValueError:  # Windows下与静态目录不在同一个盘符
+        logger.warning("PDF与静态目录不在同一磁盘，未写入paths.txt")
+        return
+    os.makedirs(base_path, exist_ok=True)
+    with open(os.path.join(base_path, 'paths.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(rel_paths))
+
+
+def compare_pdfs(file1, file2, output_dir, min_length, engine='kgram', workers=1, backend='pymupdf', cache=None,
+                 screening_threshold=0.2, output_format='json', viewer_paths=True, incremental=False,
+                 spill_mb=DEFAULT_SPILL_MB):
+    """比对两个PDF的文本，返回写出的匹配条数，失败时返回None
+
+    incremental为True且output_dir中有上一次kgram引擎的结果时，只重新提取和比对变化的页。
+    每个文档的原文超过spill_mb后移到临时文件（0表示不限制），比对只在内存中保留清洗后的文本。
+    """
     try:
         # 检查输入文件是否存在
         if not os.path.exists(file1):
@@ -342,96 +1027,445 @@ def compare_pdfs(file1, file2, output_dir, min_length):
         if not os.path.exists(file2):
             raise FileNotFoundError(f"文件不存在: {file2}")
 
-        
-        # 定义基础路径
-        base_path = "D:/Compare/static"
-        
-        # 假设 file1 和 file2 是你已经定义的文件路径
-        rel_file1 = os.path.relpath(file1, base_path)
-        rel_file2 = os.path.relpath(file2, base_path)
-        
-        # 在相对路径前加上 ./ 
-        rel_file1 = f"{rel_file1}"
-        rel_file2 = f"{rel_file2}"
-        
-        # 将相对路径写入 static/paths.txt 文件
-        with open('static/paths.txt', 'w') as f:
-            f.write(f"{rel_file1}\n{rel_file2}")
+
+        # 将相对静态目录的路径写入 static/paths.txt 文件（供showpdf.html使用，批量比对时不写）
+        if viewer_paths:
+            write_viewer_paths(file1, file2)
 
         # 检查输出目录是否存在，不存在则创建
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        output_file = os.path.join(output_dir, "CommonParagraphs.json")
+        if output_format not in OUTPUT_FILES:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        output_file = os.path.join(output_dir, OUTPUT_FILES[output_format])
+        # 删除另一种格式的旧结果，避免showpdf.html读到上一次的输出
+        for other_format, other_file in OUTPUT_FILES.items():
+            stale_file = os.path.join(output_dir, other_file)
+            if other_format != output_format and os.path.exists(stale_file):
+                os.remove(stale_file)
 
-        def extract_paragraphs(file_path, min_length):
-            paragraphs = []
-            with pdfplumber.open(file_path) as pdf:
-                for page_number, page in enumerate(pdf.pages, start=1):
-                    text = page.extract_text()
-                    if text:
-                        lines = text.split('\n')  # 按行分割文本
-                        for line_number, line in enumerate(lines, start=1):
-                            if len(line) >= min_length:
-                                paragraphs.append({
-                                    'page': page_number,
-                                    'line': line_number,
-                                    'text': line
-                                })
-            return paragraphs
-
-
-        # 提取段落
-        paragraphs1 = extract_paragraphs(file1, min_length)
-        paragraphs2 = extract_paragraphs(file2, min_length)
-
-        # 比较段落
-        common_paragraphs = []
-        seen_common_substrings = set()
-            
-        for para1 in paragraphs1:
-            for para2 in paragraphs2:
-                # 去除特殊字符
-                clean_text1 = remove_special_chars(para1['text'])
-                clean_text2 = remove_special_chars(para2['text'])
-        
-                common_substrings = find_common_substrings(clean_text1, clean_text2, min_length)
-                if common_substrings:
-                    for substring in common_substrings:
-                        if (para1['page'], para1['line'], para2['page'], para2['line'], substring) not in seen_common_substrings:
-                            seen_common_substrings.add((para1['page'], para1['line'], para2['page'], para2['line'], substring))
-                            common_paragraphs.append({
-                                'file1': file1,
-                                'page1': para1['page'],
-                                'line1': para1['line'],
-                                'text1': para1['text'],
-                                'file2': file2,
-                                'page2': para2['page'],
-                                'line2': para2['line'],
-                                'text2': para2['text'],
-                                'common_substrings': [substring]
-                            })
-
-
-        # 将结果保存到 JSON 文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'paragraphs1': paragraphs1,
-                'paragraphs2': paragraphs2,
-                'common_paragraphs': common_paragraphs
-            }, f, ensure_ascii=False, indent=4)
+        report = current_report()
+        settings = {'engine': engine, 'min_length': min_length, 'backend': backend,
+                    'extractor_version': TEXT_EXTRACTOR_VERSION}
+        # 增量比对只支持逐行的kgram引擎：后缀数组引擎的匹配可以跨行，minhash的页级筛选依赖整篇文档
+        previous = load_previous_run(output_dir, settings) if incremental and engine == 'kgram' else None
+        if incremental and previous is None:
+            logger.info("没有可沿用的上一次结果，进行完整比对")
+
+        if previous is not None:
+            with report.stage('incremental_plan'):
+                plans = [plan_incremental_pages(path, doc, paragraphs, min_length, backend)
+                         for path, doc, paragraphs in zip((file1, file2), previous['docs'], previous['paragraphs'])]
+            (paragraphs1, line_map1, changed1, manifest1, extracted1, changed_pages1), \
+                (paragraphs2, line_map2, changed2, manifest2, extracted2, changed_pages2) = plans
+            kept = [(line_map1[i], line_map2[j], substrings) for i, j, substrings in previous['matches']
+                    if i in line_map1 and j in line_map2]
+            report.count('incremental_plan', pages=len(manifest1['raw']) + len(manifest2['raw']),
+                         extracted_pages=extracted1 + extracted2, changed_pages=changed_pages1 + changed_pages2,
+                         kept_matches=len(kept))
+            # 文本行转为紧凑存储，清洗只做一次；行字典列表随即释放，后续比对和写出都基于存储
+            with report.stage('build_text_store'):
+                store1 = TextStore(paragraphs1, spill_limit(spill_mb))
+                store2 = TextStore(paragraphs2, spill_limit(spill_mb))
+            del paragraphs1, paragraphs2
+            report.count('build_text_store', spilled=int(store1.original.spilled) + int(store2.original.spilled))
+        else:
+            # 逐页提取文本行直接写入紧凑存储（命中缓存的文件从缓存逐行读出，workers > 1 时按页分片并行提取）
+            with report.stage('extract_paragraphs'):
+                store1, store2 = extract_text_stores([file1, file2], min_length, workers, backend, cache, spill_mb)
+            with report.stage('page_fingerprints'):
+                manifest1 = page_manifest(file1, store1)
+                manifest2 = page_manifest(file2, store2)
+            report.count('extract_paragraphs', lines=len(store1) + len(store2),
+                         pages=len(manifest1['raw']) + len(manifest2['raw']),
+                         chars=len(store1.clean_text) + len(store2.clean_text),
+                         spilled=int(store1.original.spilled) + int(store2.original.spilled))
+
+        # 比较段落：逐行引擎用k-gram指纹索引筛选候选行对后精确比对，
+        # 后缀数组引擎在整篇文档上求极大公共子串，可以发现跨行的匹配。
+        # 各引擎产出(行1下标, 行2下标, 行1起点, 行2起点, 长度)，再合并为每个行对一条记录
+        if previous is not None:
+            records = incremental_line_matches(store1, store2, changed1, changed2, kept, min_length)
+        elif engine == 'kgram':
+            line_matches = kgram_line_matches(store1, store2, min_length)
+        elif engine == 'suffix':
+            with report.stage('find_maximal_common_substrings'):
+                matches = find_maximal_common_substrings(store1.clean_text, store2.clean_text, min_length)
+            # 跨行匹配切分后的各段分属不同行对，排序后同一行对的段才相邻
+            line_matches = sorted(map_matches_to_lines(matches, store1, store2, min_length))
+        elif engine == 'minhash':
+            # MinHash/LSH预筛选是有损的，只对估计相似度超过阈值的行对做精确比对
+            with report.stage('minhash_screening'):
+                pairs, screening = screen_candidate_pairs(store1, store2, screening_threshold)
+            line_matches = []
+            matched_pairs = 0
+            with report.stage('find_common_substrings', pairs=len(pairs)):
+                for i, j in sorted(pairs):
+                    blocks = find_common_blocks(store1.clean(i), store2.clean(j), min_length)
+                    if blocks:
+                        matched_pairs += 1
+                        line_matches.extend((i, j, start1, start2, size) for start1, start2, size in blocks)
+            screening['matched_pairs'] = matched_pairs
+            screening['precision'] = matched_pairs / len(pairs) if pairs else 1.0
+            log_screening_summary(screening)
+        else:
+            raise ValueError(f"不支持的比对引擎: {engine}")
+        if previous is None:
+            records = coalesce_line_matches(line_matches, store1)
+
+        # 匹配结果以生成器的形式边产生边写出，不在内存中累积；同时写入按页查询的匹配索引
+        # （逐行比对在写出过程中进行，write_result 的 self_seconds 不含比对本身）
+        extra = {'screening': screening} if engine == 'minhash' else {}
+        index_path = os.path.join(output_dir, MATCH_INDEX_FILE)
+        # 先删除旧的页面清单，写出中途失败时不会把新索引和旧清单拼在一起
+        manifest_path = os.path.join(output_dir, PAGE_MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        with report.stage('write_result'):
+            with MatchIndexBuilder(index_path, file1, file2, store1, store2) as index:
+                matches = index.record(records)
+                if output_format == 'ndjson':
+                    count = write_ndjson_result(output_file, file1, file2, store1, store2, matches, extra)
+                else:
+                    count = write_json_result(output_file, file1, file2, store1, store2, matches, extra)
+        report.count('write_result', matches=count,
+                     bytes=os.path.getsize(output_file) + os.path.getsize(index_path))
+        write_page_manifest(output_dir, settings, [manifest1, manifest2], count)
+        store1.close()
+        store2.close()
+        return count
 
     except Exception as e:
         print(f"发生错误: {e}")
 
 
-def find_common_substrings(str1, str2, min_length):
+def build_kgram_index(texts, k):
+    """为文本列表建立k-gram指纹索引：k-gram哈希 -> 出现该k-gram的文本下标集合"""
+    index = defaultdict(set)
+    for j, text in enumerate(texts):
+        for pos in range(len(text) - k + 1):
+            index[hash(text[pos:pos + k])].add(j)
+    return index
+
+
+def find_candidate_pairs(texts1, texts2, min_length):
+    """立即建立texts2的指纹索引，返回用texts1的k-gram探测索引、逐行产出(i, 候选行下标列表)的生成器
+
+    长度不小于min_length的公共子串必然包含一个公共k-gram(k = min_length)，
+    没有公共k-gram的行对不可能产生匹配，可以直接跳过；哈希冲突只会多出
+    候选，由find_common_blocks精确校验，不影响结果。
+    """
+    k = max(min_length, 1)
+    with current_report().stage('build_kgram_index', lines=len(texts2)):
+        index = build_kgram_index(texts2, k)
+    return iter_candidate_pairs(texts1, index, k)
+
+
+def iter_candidate_pairs(texts1, index, k):
+    for i, text in enumerate(texts1):
+        candidates = set()
+        for pos in range(len(text) - k + 1):
+            hits = index.get(hash(text[pos:pos + k]))
+            if hits:
+                candidates |= hits
+        if candidates:
+            yield i, sorted(candidates)
+
+
+def kgram_line_matches(store1, store2, min_length, rows1=None, rows2=None):
+    """逐行引擎：按(行1, 行2)顺序产出(i, j, 行1起点, 行2起点, 长度)
+
+    rows1/rows2为参与比对的行下标（升序），默认为全部行；行文本按需从TextStore切片。
+    候选筛选与精确比对的耗时、比较的行对数在遍历结束时一次计入运行报告的
+    find_common_substrings阶段，产出后由下游写出的时间不计入。
+    """
+    rows1 = range(len(store1)) if rows1 is None else rows1
+    rows2 = range(len(store2)) if rows2 is None else rows2
+    candidate_pairs = find_candidate_pairs(store1.cleaned(rows1), store2.cleaned(rows2), min_length)
+    pairs = 0
+    elapsed = 0.0
+    resumed = time.perf_counter()
+    for a, candidates in candidate_pairs:
+        i = rows1[a]
+        text1 = store1.clean(i)
+        pairs += len(candidates)
+        for b in candidates:
+            j = rows2[b]
+            blocks = find_common_blocks(text1, store2.clean(j), min_length)
+            if blocks:
+                elapsed += time.perf_counter() - resumed
+                for start1, start2, size in blocks:
+                    yield i, j, start1, start2, size
+                resumed = time.perf_counter()
+    elapsed += time.perf_counter() - resumed
+    current_report().add('find_common_substrings', elapsed, pairs=pairs)
+
+
+# ------------------ MinHash/LSH 预筛选 ------------------
+MINHASH_SHINGLE_SIZE = 3
+MINHASH_NUM_PERM = 64
+
+
+def shingle_hashes(text, k=MINHASH_SHINGLE_SIZE):
+    """文本的字符k-gram集合，每个k-gram用crc32映射为32位整数"""
+    return {zlib.crc32(text[i:i + k].encode('utf-8')) for i in range(len(text) - k + 1)}
+
+
+class MinHasher:
+    """用 multiply-shift 哈希族 h(x) = ((a * x + b) mod 2^64) >> 32 计算MinHash签名"""
+
+    def __init__(self, num_perm=MINHASH_NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        if not hashes:
+            return None
+        x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        with np.errstate(over='ignore'):
+            values = (np.outer(self.a, x) + self.b[:, None]) >> np.uint64(32)
+        return values.min(axis=1)
+
+
+def choose_lsh_params(num_perm, threshold):
+    """选择分带数bands与每带行数rows，使S曲线的拐点 (1/bands)^(1/rows) 最接近阈值"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def lsh_candidate_probability(similarity, bands, rows):
+    """Jaccard相似度为similarity的两个集合成为候选对的概率"""
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def lsh_candidate_pairs(signatures1, signatures2, bands, rows):
+    """LSH分带：任意一带签名完全相同的(i, j)成为候选对"""
+    pairs = set()
+    for band in range(bands):
+        lo, hi = band * rows, (band + 1) * rows
+        buckets = defaultdict(list)
+        for j, signature in signatures2.items():
+            buckets[signature[lo:hi].tobytes()].append(j)
+        for i, signature in signatures1.items():
+            for j in buckets.get(signature[lo:hi].tobytes(), ()):
+                pairs.add((i, j))
+    return pairs
+
+
+def screen_candidate_pairs(store1, store2, threshold, num_perm=MINHASH_NUM_PERM):
+    """MinHash/LSH预筛选，返回(候选行对集合, 筛选统计)
+
+    逐行计算签名，用LSH找出估计相似度超过阈值的行对；同时逐页计算签名，
+    近似重复的页面之间的所有行对也作为候选，弥补单行过短时签名不稳定的问题。
+    """
+    hasher = MinHasher(num_perm)
+    bands, rows = choose_lsh_params(num_perm, threshold)
+
+    def line_and_page_signatures(store):
+        line_signatures = {}
+        page_shingles = defaultdict(set)
+        page_lines = defaultdict(list)
+        for idx in range(len(store)):
+            hashes = shingle_hashes(store.clean(idx))
+            if not hashes:
+                continue
+            line_signatures[idx] = hasher.signature(hashes)
+            page_shingles[store.pages[idx]] |= hashes
+            page_lines[store.pages[idx]].append(idx)
+        page_signatures = {page: hasher.signature(hashes) for page, hashes in page_shingles.items()}
+        return line_signatures, page_signatures, page_lines
+
+    line_sigs1, page_sigs1, page_lines1 = line_and_page_signatures(store1)
+    line_sigs2, page_sigs2, page_lines2 = line_and_page_signatures(store2)
+
+    line_pairs = lsh_candidate_pairs(line_sigs1, line_sigs2, bands, rows)
+    page_pairs = lsh_candidate_pairs(page_sigs1, page_sigs2, bands, rows)
+    pairs = set(line_pairs)
+    for page1, page2 in page_pairs:
+        pairs.update((i, j) for i in page_lines1[page1] for j in page_lines2[page2])
+
+    total_pairs = len(line_sigs1) * len(line_sigs2)
+    screening = {
+        'threshold': threshold,
+        'num_perm': num_perm,
+        'bands': bands,
+        'rows': rows,
+        'total_pairs': total_pairs,
+        'line_candidate_pairs': len(line_pairs),
+        'page_candidate_pairs': len(page_pairs),
+        'candidate_pairs': len(pairs),
+        'reduction': total_pairs / len(pairs) if pairs else float(total_pairs),
+        # 不同真实相似度下被选为候选的概率，即筛选的理论召回率
+        'recall_curve': {f"{s:.1f}": round(lsh_candidate_probability(s, bands, rows), 4)
+                         for s in (0.1, 0.2, 0.3, 0.5, 0.7, 0.9)},
+    }
+    return pairs, screening
+
+
+def log_screening_summary(screening):
+    logger.info("MinHash/LSH预筛选: 阈值 %.2f, %d 带 x %d 行", screening['threshold'], screening['bands'], screening['rows'])
+    logger.info("候选行对 %d / %d (缩减 %.1f 倍), 其中 %d 对存在匹配, 精确率 %.1f%%",
+                screening['candidate_pairs'], screening['total_pairs'], screening['reduction'],
+                screening['matched_pairs'], screening['precision'] * 100)
+    logger.info("理论召回率(相似度 -> 概率): %s",
+                ", ".join(f"{s}: {p:.1%}" for s, p in screening['recall_curve'].items()))
+
+
+def build_suffix_array(seq):
+    """倍增法构建后缀数组，seq为整数序列
+
+    rank取后缀所在桶在sa中的起始下标，每轮只对仍有并列的桶按rank[i + k]排序，
+    已经确定位置的后缀不再参与排序。
+    """
+    n = len(seq)
+    sa = sorted(range(n), key=seq.__getitem__)
+    rank = [0] * n
+    buckets = []
+    lo = 0
+    for idx in range(1, n + 1):
+        if idx == n or seq[sa[idx]] != seq[sa[lo]]:
+            for t in range(lo, idx):
+                rank[sa[t]] = lo
+            if idx - lo > 1:
+                buckets.append((lo, idx))
+            lo = idx
+
+    k = 1
+    while buckets:
+        # 先用本轮旧的rank算出所有桶的排序结果，再统一更新rank
+        updates = []
+        for lo, hi in buckets:
+            keyed = sorted((rank[i + k] if i + k < n else -1, i) for i in sa[lo:hi])
+            updates.append((lo, hi, keyed))
+        buckets = []
+        for lo, hi, keyed in updates:
+            start = lo
+            for t in range(lo, hi + 1):
+                if t == hi or keyed[t - lo][0] != keyed[start - lo][0]:
+                    for u in range(start, t):
+                        sa[u] = keyed[u - lo][1]
+                        rank[sa[u]] = start
+                    if t - start > 1:
+                        buckets.append((start, t))
+                    start = t
+        k <<= 1
+    return sa
+
+
+def build_lcp_array(seq, sa):
+    """Kasai算法计算LCP数组，lcp[r]为sa[r-1]与sa[r]两个后缀的最长公共前缀长度"""
+    n = len(seq)
+    rank = [0] * n
+    for r, pos in enumerate(sa):
+        rank[pos] = r
+    lcp = [0] * n
+    h = 0
+    for i in range(n):
+        r = rank[i]
+        if r == 0:
+            h = 0
+            continue
+        j = sa[r - 1]
+        while i + h < n and j + h < n and seq[i + h] == seq[j + h]:
+            h += 1
+        lcp[r] = h
+        if h:
+            h -= 1
+    return lcp
+
+
+def find_maximal_common_substrings(text1, text2, min_length):
+    """在两段完整文本上求所有长度不小于min_length的极大公共子串
+
+    返回按位置排序的(text1起点, text2起点, 长度)列表。两段文本用分隔符拼接后
+    构建后缀数组与LCP数组，自底向上遍历LCP区间：同一区间中来自不同子区间的
+    后缀向右无法再延伸，再要求两者前一个字符不同保证向左也无法延伸。
+    """
+    if not text1 or not text2:
+        return []
+    min_length = max(min_length, 1)
+    n1 = len(text1)
+    seq = [ord(c) for c in text1] + [-1] + [ord(c) for c in text2]
+    n = len(seq)
+    sa = build_suffix_array(seq)
+    lcp = build_lcp_array(seq, sa)
+    matches = []
+
+    def merge(node, groups):
+        # groups: 前一个字符 -> (text1中的位置列表, text2中的位置列表)
+        depth, target = node
+        if depth < min_length:
+            return
+        for c1, (pos1_a, pos1_b) in target.items():
+            for c2, (pos2_a, pos2_b) in groups.items():
+                if c1 != c2:
+                    matches.extend((a, b, depth) for a in pos1_a for b in pos2_b)
+                    matches.extend((a, b, depth) for a in pos2_a for b in pos1_b)
+        for c2, (pos2_a, pos2_b) in groups.items():
+            pos_a, pos_b = target.setdefault(c2, ([], []))
+            pos_a.extend(pos2_a)
+            pos_b.extend(pos2_b)
+
+    stack = [(0, {})]
+    for r in range(n):
+        p = sa[r]
+        if p < n1:
+            leaf = {seq[p - 1] if p > 0 else None: ([p], [])}
+        elif p > n1:
+            leaf = {seq[p - 1]: ([], [p - n1 - 1])}
+        else:
+            leaf = {}
+        h = lcp[r + 1] if r + 1 < n else 0
+        if h > stack[-1][0]:
+            stack.append((h, {}))
+            merge(stack[-1], leaf)
+            continue
+        merge(stack[-1], leaf)
+        while stack[-1][0] > h:
+            node = stack.pop()
+            if stack[-1][0] < h:
+                stack.append((h, {}))
+            merge(stack[-1], node[1])
+
+    matches.sort()
+    return matches
+
+
+def map_matches_to_lines(matches, store1, store2, min_length):
+    """把整篇清洗后文本上的匹配映射回行，跨行的匹配按两侧的换行位置切分成多段
+
+    逐段产出(文档1行下标, 文档2行下标, 行1起点, 行2起点, 长度)。切分后短于min_length的段
+    （如跨行匹配在相邻行上碰巧相同的一两个字）不产出，与逐行引擎的结果一致。
+    """
+    starts1 = store1.clean_starts
+    starts2 = store2.clean_starts
+    for a, b, length in matches:
+        offset = 0
+        while offset < length:
+            pos1 = a + offset
+            pos2 = b + offset
+            i = bisect.bisect_right(starts1, pos1) - 1
+            j = bisect.bisect_right(starts2, pos2) - 1
+            size = min(starts1[i + 1] - pos1, starts2[j + 1] - pos2, length - offset)
+            if size >= min_length:
+                yield i, j, pos1 - starts1[i], pos2 - starts2[j], size
+            offset += size
+
+
+def find_common_blocks(str1, str2, min_length):
+    """SequenceMatcher找出的长度不小于min_length的匹配块[(str1起点, str2起点, 长度)]"""
     matcher = SequenceMatcher(None, str1, str2)
-    common_substrings = []
-    for match in matcher.get_matching_blocks():
-        if match.size >= min_length:
-            common_substrings.append(str1[match.a:match.a + match.size])
-    return common_substrings
+    return [tuple(match) for match in matcher.get_matching_blocks() if match.size >= min_length]
 
 def remove_special_chars(text):
     # 保留中文字符，去除其他特殊字符
@@ -472,8 +1506,11 @@ def extract_images_from_pdf(pdf_path, output_folder):
 
     
 # ================== 主控制流程 ==================
-def process_files(file1: str, file2: str, output_dir: str, min_length: int):
-    """统一处理入口"""
+def process_files(file1: str, file2: str, output_dir: str, min_length: int, engine: str = 'kgram', workers: int = 1,
+                  backend: str = 'pymupdf', cache: ExtractCache = None, screening_threshold: float = 0.2,
+                  output_format: str = 'json', viewer_paths: bool = True, incremental: bool = False,
+                  spill_mb: float = DEFAULT_SPILL_MB):
+    """统一处理入口，返回匹配条数（PDF比对失败时为None）"""
     def get_ext(path: str) -> str:
         return os.path.splitext(path)[1].lower()
     
@@ -487,15 +1524,305 @@ def process_files(file1: str, file2: str, output_dir: str, min_length: int):
     if file_type == '.docx':
         output1 = os.path.join(output_dir, f"{base1}_compared.docx")
         output2 = os.path.join(output_dir, f"{base2}_compared.docx")
-        mark_common_text_in_word(file1, file2, output1, output2, min_length)
+        return mark_common_text_in_word(file1, file2, output1, output2, min_length, cache)
     elif file_type == '.pdf':
         output = os.path.join(output_dir, "JsonFromPdf")
-        compare_pdfs(file1, file2, output, min_length)
+        return compare_pdfs(file1, file2, output, min_length, engine, workers, backend, cache, screening_threshold,
+                            output_format, viewer_paths, incremental, spill_mb)
         
     else:
         raise ValueError(f"不支持的格式: {file_type}")
 # min_length 内容对比阈值  output 输出路径
-def main():
+# ================== 批量命令行 ==================
+BATCH_COMMANDS = ('text', 'image', 'all', 'pages')
+RESULT_FILE = 'result.json'
+SUMMARY_FILE = 'summary.json'
+
+
+def read_manifest(manifest_path):
+    """读取比对清单：CSV每行 file1,file2[,输出目录]，#开头的行和file1,file2表头被忽略"""
+    pairs = []
+    with open(manifest_path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            if row[:2] == ['file1', 'file2']:
+                continue
+            if len(row) < 2:
+                raise ValueError(f"清单格式错误，至少需要两列: {row}")
+            pairs.append((row[0], row[1], row[2] if len(row) > 2 and row[2] else None))
+    return pairs
+
+
+def make_job(index, mode, file1, file2, output_dir, min_length=13, engine='kgram', extract_workers=1,
+             backend='pymupdf', screening_threshold=0.2, output_format='json', cache_path=DEFAULT_CACHE_PATH,
+             max_distance=10, profile=None, incremental=False, spill_mb=DEFAULT_SPILL_MB):
+    """生成run_comparison_job使用的任务字典，cache_path为None时不使用缓存"""
+    if mode not in BATCH_COMMANDS:
+        raise ValueError(f"不支持的比对类型: {mode}")
+    return {
+        'index': index,
+        'mode': mode,
+        'file1': file1,
+        'file2': file2,
+        'output_dir': output_dir,
+        'min_length': min_length,
+        'engine': engine,
+        'extract_workers': extract_workers,
+        'backend': backend,
+        'screening_threshold': screening_threshold,
+        'output_format': output_format,
+        'cache_path': cache_path,
+        'max_distance': max_distance,
+        'profile': profile,
+        'incremental': incremental,
+        'spill_mb': spill_mb,
+    }
+
+
+def build_jobs(args):
+    """根据命令行参数生成比对任务列表"""
+    if args.manifest:
+        pairs = read_manifest(args.manifest)
+    else:
+        if len(args.files) % 2:
+            raise ValueError("待比对文件必须成对给出")
+        pairs = [(args.files[i], args.files[i + 1], None) for i in range(0, len(args.files), 2)]
+
+    jobs = []
+    for index, (file1, file2, output_dir) in enumerate(pairs):
+        if output_dir is None:
+            stem1 = os.path.splitext(os.path.basename(file1))[0]
+            stem2 = os.path.splitext(os.path.basename(file2))[0]
+            output_dir = os.path.join(args.output, f"{index:05d}_{stem1}__{stem2}")
+        jobs.append(make_job(index, args.command, file1, file2, output_dir, args.min_length, args.engine,
+                             args.extract_workers, args.backend, args.screening_threshold, args.output_format,
+                             None if args.no_cache else args.cache_path, args.max_distance, args.profile,
+                             args.incremental, args.spill_mb))
+    return jobs
+
+
+def write_job_result(result):
+    """把单个任务的结果写到该任务输出目录下的result.json"""
+    try:
+        os.makedirs(result['output_dir'], exist_ok=True)
+        with open(os.path.join(result['output_dir'], RESULT_FILE), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+    except OSError as e:
+        logger.warning("无法写入任务结果 %s: %s", result['output_dir'], e)
+
+
+def run_comparison_job(job):
+    """执行一个比对任务（在独立子进程中运行），返回结果字典"""
+    start = time.perf_counter()
+    result = {key: job[key] for key in ('index', 'mode', 'file1', 'file2', 'output_dir')}
+    report = start_report(f"{job['mode']}: {job['file1']} <-> {job['file2']}")
+    try:
+        for path in (job['file1'], job['file2']):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"文件不存在: {path}")
+        os.makedirs(job['output_dir'], exist_ok=True)
+        cache = ExtractCache(job['cache_path']) if job['cache_path'] else None
+        file_type = os.path.splitext(job['file1'])[1].lower()
+
+        with profiled(job.get('profile'), job['output_dir']) as profile_path:
+            if job['mode'] in ('text', 'all'):
+                count = process_files(job['file1'], job['file2'], job['output_dir'], job['min_length'],
+                                      engine=job['engine'], workers=job['extract_workers'], backend=job['backend'],
+                                      cache=cache, screening_threshold=job['screening_threshold'],
+                                      output_format=job['output_format'], viewer_paths=False,
+                                      incremental=job.get('incremental', False),
+                                      spill_mb=job.get('spill_mb', DEFAULT_SPILL_MB))
+                if count is None:
+                    raise RuntimeError("文本比对失败")
+                result['text_matches'] = count
+
+            # 图片比对只支持PDF；all模式下遇到Word文档只做文本比对
+            if job['mode'] == 'image' or (job['mode'] == 'all' and file_type == '.pdf'):
+                if file_type != '.pdf' or os.path.splitext(job['file2'])[1].lower() != '.pdf':
+                    raise ValueError("图片比对只支持PDF文件")
+                images = compare_pdf_images(job['file1'], job['file2'], job['output_dir'], cache,
+                                            job['max_distance'])
+                result['common_images'] = images['common_images']
+                result['html'] = images['html']
+
+            if job['mode'] == 'pages':
+                if file_type != '.pdf' or os.path.splitext(job['file2'])[1].lower() != '.pdf':
+                    raise ValueError("整页比对只支持PDF文件")
+                pages = compare_pdf_pages(job['file1'], job['file2'], job['output_dir'], cache,
+                                          workers=job['extract_workers'])
+                result['common_pages'] = pages['common_pages']
+                result['html'] = pages['html']
+        if profile_path:
+            result['profile'] = profile_path
+
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['elapsed'] = round(time.perf_counter() - start, 3)
+    result['report'] = report.to_dict()
+    write_job_result(result)
+    return result
+
+
+def _job_process_main(job, results):
+    results.put(run_comparison_job(job))
+
+
+def run_jobs(jobs, workers, timeout=None, on_result=None):
+    """在最多workers个子进程中并发执行任务，超过timeout秒的任务被终止
+
+    每个任务独占一个子进程，超时或崩溃只影响该任务本身；返回按任务顺序排列的结果。
+    """
+    context = multiprocessing.get_context()
+    results_queue = context.Queue()
+    pending = list(reversed(jobs))
+    running = {}  # index -> (进程, 任务, 开始时间)
+    results = {}
+
+    def finish(result):
+        results[result['index']] = result
+        if on_result:
+            on_result(result)
+
+    def collect(wait):
+        # 收取已完成任务的结果；已按超时处理的任务再送达的结果直接丢弃
+        try:
+            result = results_queue.get(timeout=wait) if wait else results_queue.get_nowait()
+            while True:
+                entry = running.pop(result['index'], None)
+                if entry is not None:
+                    entry[0].join()
+                    finish(result)
+                result = results_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop()
+            process = context.Process(target=_job_process_main, args=(job, results_queue))
+            process.start()
+            running[job['index']] = (process, job, time.monotonic())
+
+        # 先收取已完成任务的结果，再检查超时和异常退出的进程
+        collect(0.2)
+        now = time.monotonic()
+        for index, (process, job, started) in list(running.items()):
+            if index not in running:
+                continue
+            if timeout and now - started > timeout:
+                process.terminate()
+                status, error = 'timeout', f"超过{timeout}秒未完成"
+            elif not process.is_alive():
+                # 进程退出前已把结果写入队列，收取后即不再处于running中
+                collect(0)
+                if index not in running:
+                    continue
+                status, error = 'error', f"子进程异常退出，退出码{process.exitcode}"
+            else:
+                continue
+            process.join()
+            del running[index]
+            result = {key: job[key] for key in ('index', 'mode', 'file1', 'file2', 'output_dir')}
+            result.update(status=status, error=error, elapsed=round(now - started, 3))
+            write_job_result(result)
+            finish(result)
+
+    return [results[job['index']] for job in jobs]
+
+
+def run_batch(args):
+    """无界面批量比对入口，返回进程退出码"""
+    jobs = build_jobs(args)
+    if not jobs:
+        print("没有待比对的文件")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    done = 0
+
+    def report(result):
+        nonlocal done
+        done += 1
+        print(f"[{done}/{len(jobs)}] {result['status']} {result['file1']} <-> {result['file2']}"
+              f" ({result['elapsed']}s)", flush=True)
+
+    results = run_jobs(jobs, args.jobs, args.timeout, report)
+
+    summary = {
+        'command': args.command,
+        'total': len(results),
+        'ok': sum(r['status'] == 'ok' for r in results),
+        'error': sum(r['status'] == 'error' for r in results),
+        'timeout': sum(r['status'] == 'timeout' for r in results),
+        'wall_time': round(time.perf_counter() - start, 3),
+        'text_matches': sum(r.get('text_matches', 0) for r in results),
+        'common_images': sum(r.get('common_images', 0) for r in results),
+        'common_pages': sum(r.get('common_pages', 0) for r in results),
+        'stages': merge_reports(r['report'] for r in results if 'report' in r),
+        'jobs': results,
+    }
+    summary_path = os.path.join(args.output, SUMMARY_FILE)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+
+    print(f"完成 {summary['total']} 对：成功 {summary['ok']}，失败 {summary['error']}，超时 {summary['timeout']}，"
+          f"耗时 {summary['wall_time']}s，汇总见 {summary_path}")
+    return 0 if summary['ok'] == summary['total'] else 2
+
+
+def add_text_arguments(parser):
+    parser.add_argument('--engine', choices=TEXT_ENGINES, default='kgram', help="PDF文本比对引擎")
+    parser.add_argument('--screening-threshold', type=float, default=0.2, help="minhash引擎预筛选的Jaccard相似度阈值")
+    parser.add_argument('--backend', choices=sorted(EXTRACTION_BACKENDS), default='pymupdf', help="PDF文本提取后端")
+    parser.add_argument('--output-format', choices=sorted(OUTPUT_FILES), default='json',
+                        help="PDF比对结果格式：json为兼容格式，ndjson为流式规范化格式")
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH, help="提取结果缓存路径")
+    parser.add_argument('--no-cache', action='store_true', help="不使用提取结果缓存")
+    parser.add_argument('--profile', choices=sorted(PROFILE_FILES),
+                        help="剖析比对过程，结果写到输出目录（pyinstrument需要另行安装）")
+    parser.add_argument('--incremental', action='store_true',
+                        help="输出目录中已有上一次的kgram比对结果时，只重新提取和比对内容变化的PDF页")
+    parser.add_argument('--spill-mb', type=float, default=DEFAULT_SPILL_MB,
+                        help="每个PDF的原文超过该大小(MB)后移到临时文件，0表示全部留在内存")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="多功能文档比对工具",
+                                     epilog="不带子命令运行时弹出文件选择对话框（等同于gui子命令）")
+    subparsers = parser.add_subparsers(dest='command')
+
+    gui = subparsers.add_parser('gui', help="通过对话框选择文件进行文本比对")
+    add_text_arguments(gui)
+    gui.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="PDF文本提取的进程数")
+
+    helps = {'text': "批量比对文本", 'image': "批量比对PDF中的图片", 'all': "批量比对文本和图片",
+             'pages': "批量比对PDF渲染后的整页（矢量图、扫描页等）"}
+    for command in BATCH_COMMANDS:
+        batch = subparsers.add_parser(command, help=helps[command])
+        batch.add_argument('files', nargs='*', help="成对给出的待比对文件：a1 b1 a2 b2 ...")
+        batch.add_argument('--manifest', help="比对清单CSV，每行 file1,file2[,输出目录]")
+        batch.add_argument('-o', '--output', default='output/batch', help="输出根目录，每对文件一个子目录")
+        batch.add_argument('--min-length', type=int, default=13, help="最小匹配长度")
+        batch.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="同时执行的比对任务数")
+        batch.add_argument('--timeout', type=float, default=600, help="单个任务的超时秒数，0表示不限制")
+        batch.add_argument('--extract-workers', type=int, default=1, help="单个任务内PDF文本提取/页面渲染的进程数")
+        batch.add_argument('--max-distance', type=int, default=10, help="图片感知哈希的最大汉明距离")
+        add_text_arguments(batch)
+    return parser
+
+
+def run_dialog(args):
+    """弹出对话框选择文件后比对（原有的交互方式）"""
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, simpledialog
+
+    cache = None if args.no_cache else ExtractCache(args.cache_path)
+
     root = tk.Tk()
     root.withdraw()  # 隐藏主窗口
 
@@ -518,15 +1845,33 @@ def main():
         return
 
     # 获取最小匹配长度
-    min_length = tk.simpledialog.askinteger("输入", "请输入最小匹配长度（默认：13字符 ）", initialvalue=13)
+    min_length = simpledialog.askinteger("输入", "请输入最小匹配长度（默认：13字符 ）", initialvalue=13)
     if min_length is None:
         min_length = 13
 
     try:
-        process_files(file1, file2, output_dir, min_length)
+        report = start_report(f"gui: {file1} <-> {file2}")
+        with profiled(args.profile, output_dir):
+            process_files(file1, file2, output_dir, min_length, engine=args.engine, workers=args.workers,
+                          backend=args.backend, cache=cache, screening_threshold=args.screening_threshold,
+                          output_format=args.output_format, incremental=args.incremental, spill_mb=args.spill_mb)
+        report.write(os.path.join(output_dir, REPORT_FILE))
+        report.log(logger)
         messagebox.showinfo("成功", f"处理完成！结果保存在：{output_dir}")
     except Exception as e:
         messagebox.showerror("错误", f"处理失败：{e}")
 
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # 兼容旧用法：不带子命令时进入对话框模式
+    if not argv or argv[0] not in BATCH_COMMANDS + ('gui', '-h', '--help'):
+        argv = ['gui'] + argv
+    args = build_arg_parser().parse_args(argv)
+
+    if args.command == 'gui':
+        return run_dialog(args)
+    return run_batch(args)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+一对多语料库比对
+把一个目录下的PDF/DOCX建成持久化的倒排索引（文本指纹 -> 文档，图片md5 -> 文档），
+查询时先用索引给语料库中的文档按重合度排序，再只对排名靠前的候选文档做逐行精确比对。
+
+命令行：
+    python corpus.py index 存档目录 [--db corpus.sqlite3]
+    python corpus.py query 待查文件 [--top 5] [--output 输出目录]
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+import argparse
+import contextlib
+
+from docx import Document
+
+from compare import extract_paragraphs_cached, remove_special_chars, process_files
+from extract_cache import ExtractCache, file_digest
+from ExtractImageFromPdf import extract_image_md5s, IMAGE_EXTRACTOR_VERSION
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'corpus.sqlite3')
+SUPPORTED_EXTS = ('.pdf', '.docx')
+
+# 指纹参数：k-gram长度与winnowing窗口，长度不小于 SHINGLE_SIZE + WINDOW_SIZE - 1 的
+# 公共子串保证至少命中一个公共指纹
+SHINGLE_SIZE = 8
+WINDOW_SIZE = 6
+
+
+def stable_hash(text):
+    """跨进程稳定的64位哈希（内置hash()每个进程的种子不同，不能持久化）"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def winnow_fingerprints(text, k=SHINGLE_SIZE, window=WINDOW_SIZE):
+    """winnowing选取文本指纹：每个连续window个k-gram哈希中取最小值"""
+    hashes = [stable_hash(text[i:i + k]) for i in range(len(text) - k + 1)]
+    if len(hashes) <= window:
+        return set(hashes)
+    return {min(hashes[i:i + window]) for i in range(len(hashes) - window + 1)}
+
+
+def extract_document_text(path, cache=None):
+    """提取文档的清洗后全文（仅保留中文字符），行与行直接拼接以便发现跨行的重合"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.pdf':
+        paragraphs, = extract_paragraphs_cached([path], 1, cache=cache)
+        return ''.join(remove_special_chars(para['text']) for para in paragraphs)
+    if ext == '.docx':
+        return ''.join(remove_special_chars(para.text) for para in Document(path).paragraphs)
+    raise ValueError(f"不支持的格式: {ext}")
+
+
+def extract_document_images(path, cache=None):
+    """PDF返回图片md5集合（只读原始图片流，不解码），其它格式暂不索引图片"""
+    if os.path.splitext(path)[1].lower() != '.pdf':
+        return set()
+    return set(extract_image_md5s(path, cache))
+
+
+class CorpusIndex:
+    """语料库倒排索引，存放在SQLite中"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " id INTEGER PRIMARY KEY,"
+                " path TEXT UNIQUE NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " fingerprint_count INTEGER NOT NULL,"
+                " image_count INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS shingles ("
+                " hash INTEGER NOT NULL,"
+                " doc_id INTEGER NOT NULL,"
+                " PRIMARY KEY (hash, doc_id)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS images ("
+                " hash TEXT NOT NULL,"
+                " doc_id INTEGER NOT NULL,"
+                " PRIMARY KEY (hash, doc_id)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            )
+            params = f"{SHINGLE_SIZE}:{WINDOW_SIZE}:{IMAGE_EXTRACTOR_VERSION}"
+            row = conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('params', ?)", (params,))
+            elif row[0] != params:
+                raise ValueError(f"索引指纹参数({row[0]})与当前版本({params})不一致，请重建索引")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_document(self, path, cache=None):
+        """索引单个文档，内容未变化的文档直接跳过；返回是否重新索引"""
+        path = os.path.abspath(path)
+        digest = file_digest(path)
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, digest FROM documents WHERE path = ?", (path,)).fetchone()
+            if row and row[1] == digest:
+                return False
+
+        fingerprints = winnow_fingerprints(extract_document_text(path, cache))
+        images = extract_document_images(path, cache)
+
+        with self._connect() as conn:
+            if row:
+                conn.execute("DELETE FROM shingles WHERE doc_id = ?", (row[0],))
+                conn.execute("DELETE FROM images WHERE doc_id = ?", (row[0],))
+                conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+            doc_id = conn.execute(
+                "INSERT INTO documents (path, digest, fingerprint_count, image_count) VALUES (?, ?, ?, ?)",
+                (path, digest, len(fingerprints), len(images))
+            ).lastrowid
+            conn.executemany("INSERT INTO shingles (hash, doc_id) VALUES (?, ?)", ((h, doc_id) for h in fingerprints))
+            conn.executemany("INSERT INTO images (hash, doc_id) VALUES (?, ?)", ((h, doc_id) for h in images))
+        return True
+
+    def add_directory(self, directory, cache=None):
+        """递归索引目录下所有PDF/DOCX，返回(新索引数, 跳过数)"""
+        indexed = skipped = 0
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTS:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if self.add_document(path, cache):
+                        indexed += 1
+                        print(f"已索引: {path}")
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    print(f"❌ 索引失败 {path}: {e}")
+        return indexed, skipped
+
+    def query(self, path, top=10, cache=None):
+        """返回与待查文档重合度最高的候选文档
+
+        每项为 {'path', 'coverage', 'containment', 'shared', 'shared_images'}：
+        coverage为待查文档指纹被该文档覆盖的比例，containment为该文档自身指纹
+        出现在待查文档中的比例。
+        """
+        fingerprints = winnow_fingerprints(extract_document_text(path, cache))
+        images = extract_document_images(path, cache)
+        query_path = os.path.abspath(path)
+
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE query_shingles (hash INTEGER PRIMARY KEY)")
+            conn.execute("CREATE TEMP TABLE query_images (hash TEXT PRIMARY KEY)")
+            conn.executemany("INSERT INTO query_shingles (hash) VALUES (?)", ((h,) for h in fingerprints))
+            conn.executemany("INSERT INTO query_images (hash) VALUES (?)", ((h,) for h in images))
+            shared = dict(conn.execute(
+                "SELECT s.doc_id, COUNT(*) FROM query_shingles q JOIN shingles s ON s.hash = q.hash GROUP BY s.doc_id"
+            ).fetchall())
+            shared_images = dict(conn.execute(
+                "SELECT i.doc_id, COUNT(*) FROM query_images q JOIN images i ON i.hash = q.hash GROUP BY i.doc_id"
+            ).fetchall())
+            doc_ids = set(shared) | set(shared_images)
+            documents = {}
+            for doc_id in doc_ids:
+                documents[doc_id] = conn.execute(
+                    "SELECT path, fingerprint_count FROM documents WHERE id = ?", (doc_id,)
+                ).fetchone()
+
+        results = []
+        for doc_id, (doc_path, fingerprint_count) in documents.items():
+            if doc_path == query_path:
+                continue
+            count = shared.get(doc_id, 0)
+            results.append({
+                'path': doc_path,
+                'coverage': count / len(fingerprints) if fingerprints else 0.0,
+                'containment': count / fingerprint_count if fingerprint_count else 0.0,
+                'shared': count,
+                'shared_images': shared_images.get(doc_id, 0),
+            })
+        results.sort(key=lambda r: (r['coverage'], r['shared_images']), reverse=True)
+        return results[:top]
+
+    def stats(self):
+        with self._connect() as conn:
+            documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            shingles = conn.execute("SELECT COUNT(*) FROM shingles").fetchone()[0]
+        return {'documents': documents, 'fingerprints': shingles}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="一对多语料库比对")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="索引数据库路径")
+    parser.add_argument('--no-cache', action='store_true', help="不使用提取结果缓存")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help="把目录下的PDF/DOCX加入索引")
+    index_parser.add_argument('directory')
+
+    query_parser = subparsers.add_parser('query', help="查询与待查文件重合的文档")
+    query_parser.add_argument('file')
+    query_parser.add_argument('--top', type=int, default=5, help="对排名前N的候选做精确比对")
+    query_parser.add_argument('--min-coverage', type=float, default=0.0, help="低于该覆盖率的候选不做精确比对")
+    query_parser.add_argument('--min-length', type=int, default=13, help="精确比对的最小匹配长度")
+    query_parser.add_argument('--output', default='output/corpus', help="精确比对结果输出目录")
+    query_parser.add_argument('--no-detail', action='store_true', help="只输出候选排名，不做精确比对")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else ExtractCache()
+    index = CorpusIndex(args.db)
+
+    if args.command == 'index':
+        indexed, skipped = index.add_directory(args.directory, cache)
+        stats = index.stats()
+        print(f"新索引 {indexed} 个文档，跳过未变化的 {skipped} 个；索引共 {stats['documents']} 个文档")
+        return
+
+    results = index.query(args.file, args.top, cache)
+    if not results:
+        print("语料库中没有与该文件重合的文档")
+        return
+    for rank, result in enumerate(results, start=1):
+        print(f"{rank:>3}. 覆盖率 {result['coverage']:.1%}  被包含 {result['containment']:.1%}  "
+              f"相同图片 {result['shared_images']}  {result['path']}")
+
+    if args.no_detail:
+        return
+    for rank, result in enumerate(results, start=1):
+        if result['coverage'] < args.min_coverage:
+            continue
+        base = os.path.splitext(os.path.basename(result['path']))[0]
+        output_dir = os.path.join(args.output, f"{rank:02d}_{base}")
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            process_files(args.file, result['path'], output_dir, args.min_length, cache=cache)
+            print(f"精确比对结果: {output_dir}")
+        except ValueError as e:
+            print(f"跳过 {result['path']}: {e}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
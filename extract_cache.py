@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+提取结果缓存
+以PDF文件内容的SHA-256 + 提取器版本 + 提取参数为键，把提取出的文本行、图片摘要
+压缩后存入SQLite，超过容量上限时按最近使用时间淘汰。
+
+命令行：
+    python extract_cache.py stats          查看缓存占用
+    python extract_cache.py list           列出缓存条目
+    python extract_cache.py purge          清空缓存
+    python extract_cache.py purge --kind text  只清除某一类条目
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import contextlib
+import hashlib
+import argparse
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'extract_cache.sqlite3')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 默认缓存上限 512MB
+READ_CHUNK_SIZE = 64 * 1024  # 逐个读出列表元素时每次解压的字节数
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ExtractCache:
+    """内容寻址的提取结果缓存，值为可JSON序列化的对象"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " source TEXT,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " data BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # 每次操作单独连接，事务结束后提交并关闭，便于多线程/多进程共用同一缓存文件
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(kind, digest, version, options):
+        """缓存键：类型、文件摘要、提取器版本与参数共同决定"""
+        return f"{kind}:{digest}:{version}:{json.dumps(options, sort_keys=True)}"
+
+    def get(self, key):
+        """命中时返回缓存的对象并刷新访问时间，未命中返回None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def get_items(self, key):
+        """命中时返回逐个产出列表元素的迭代器，未命中返回None
+
+        record_items写入的条目每行一个元素，边解压边解析，不会同时持有整个列表。
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return self._iter_items(row[0])
+
+    @staticmethod
+    def _iter_items(data):
+        decompressor = zlib.decompressobj()
+
+        def lines():
+            pending = b''
+            for offset in range(0, len(data), READ_CHUNK_SIZE):
+                pending += decompressor.decompress(data[offset:offset + READ_CHUNK_SIZE])
+                *complete, pending = pending.split(b'\n')
+                yield from complete
+            yield pending + decompressor.flush()
+
+        line_iter = lines()
+        first = next(line_iter)
+        if first != b'[':
+            # put写入的条目是单行JSON，整体解析
+            yield from json.loads(first + b''.join(line_iter))
+            return
+        for line in line_iter:
+            if line and line != b']':
+                yield json.loads(line.rstrip(b','))
+
+    def record_items(self, key, kind, digest, items, source=None):
+        """透传items中的元素，同时逐个压缩；全部迭代完后写入缓存，中途停止或出错时不写入
+
+        条目仍是合法的JSON数组（每行一个元素），get与get_items都可以读取。
+        """
+        compressor = zlib.compressobj()
+        chunks = [compressor.compress(b'[')]
+        separator = b'\n'
+        for item in items:
+            chunks.append(compressor.compress(separator + json.dumps(item, ensure_ascii=False).encode('utf-8')))
+            separator = b',\n'
+            yield item
+        chunks.append(compressor.compress(b'\n]'))
+        chunks.append(compressor.flush())
+        self._write(key, kind, digest, b''.join(chunks), source)
+
+    def put(self, key, kind, digest, value, source=None):
+        self._write(key, kind, digest, zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8')), source)
+
+    def _write(self, key, kind, digest, data, source):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, digest, source, size, created, last_access, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, digest, source, len(data), now, now, data)
+            )
+        self.evict()
+
+    def get_or_extract(self, kind, path, version, options, extract):
+        """读取缓存，未命中时调用extract()提取并写入缓存"""
+        digest = file_digest(path)
+        key = self.make_key(kind, digest, version, options)
+        value = self.get(key)
+        if value is None:
+            value = extract()
+            self.put(key, kind, digest, value, source=os.path.abspath(path))
+        return value
+
+    def evict(self):
+        """总大小超过上限时，从最久未使用的条目开始删除"""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+    def stats(self):
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {'path': self.path, 'entries': count, 'bytes': total, 'max_bytes': self.max_bytes}
+
+    def entries(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT kind, digest, source, size, last_access FROM entries ORDER BY last_access DESC"
+            ).fetchall()
+
+    def purge(self, kind=None):
+        with self._connect() as conn:
+            if kind:
+                cursor = conn.execute("DELETE FROM entries WHERE kind = ?", (kind,))
+            else:
+                cursor = conn.execute("DELETE FROM entries")
+            removed = cursor.rowcount
+        with self._connect() as conn:
+            conn.execute("VACUUM")
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提取结果缓存管理")
+    parser.add_argument('--path', default=DEFAULT_CACHE_PATH, help="缓存数据库路径")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="查看缓存占用")
+    subparsers.add_parser('list', help="列出缓存条目")
+    purge_parser = subparsers.add_parser('purge', help="清除缓存")
+    purge_parser.add_argument('--kind', help="只清除某一类条目，例如 text / image")
+    args = parser.parse_args()
+
+    cache = ExtractCache(args.path)
+    if args.command == 'stats':
+        stats = cache.stats()
+        print(f"缓存文件: {stats['path']}")
+        print(f"条目数: {stats['entries']}")
+        print(f"占用: {stats['bytes'] / 1024 / 1024:.2f} MB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    elif args.command == 'list':
+        for kind, digest, source, size, last_access in cache.entries():
+            accessed = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_access))
+            print(f"{kind:<6} {digest[:12]} {size:>10} {accessed} {source}")
+    elif args.command == 'purge':
+        print(f"已清除 {cache.purge(args.kind)} 个条目")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+运行报告与性能剖析
+RunReport 按阶段累计耗时和计数（页数、比较的行对数、匹配数、写出字节数等），
+阶段可以嵌套，父阶段的 self_seconds 不含子阶段的时间；结束时连同峰值内存输出为
+JSON。比对流程通过 current_report() 取得当前报告，无需层层传参。
+
+profiled() 在 --profile 时用 cProfile（或已安装的 pyinstrument）剖析一段代码。
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_FILE = 'run_report.json'
+PROFILE_FILES = {'cprofile': 'profile.prof', 'pyinstrument': 'profile.html'}
+
+
+def peak_rss_mb():
+    """当前进程（及其已结束的子进程）的峰值常驻内存，无法获取时返回None"""
+    if resource is not None:
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # Linux单位为KB，macOS为字节
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return round(getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024), 1)
+
+
+class RunReport:
+    """一次运行的分阶段计时与计数"""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}  # 阶段名 -> {'calls', 'seconds', 'self_seconds', 计数...}
+        self._stack = []  # 正在执行的阶段：[阶段名, 开始时间, 子阶段累计时间]
+
+    def _stats(self, name):
+        return self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0})
+
+    @contextlib.contextmanager
+    def stage(self, name, **counters):
+        """计时一个阶段，可多次进入（calls累加），counters同时累加到该阶段"""
+        frame = [name, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            stats = self._stats(name)
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            stats['self_seconds'] += elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            self.count(name, **counters)
+
+    def add(self, name, seconds, **counters):
+        """把在stage之外自行计时的耗时计入阶段，同样从当前父阶段的self_seconds中扣除
+
+        用于热点循环：循环内只累加计时和计数，结束时调用一次，避免每次迭代进出stage的开销。
+        """
+        stats = self._stats(name)
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['self_seconds'] += seconds
+        if self._stack:
+            self._stack[-1][2] += seconds
+        self.count(name, **counters)
+
+    def count(self, name, **counters):
+        stats = self._stats(name)
+        for key, value in counters.items():
+            stats[key] = stats.get(key, 0) + value
+
+    def to_dict(self):
+        stages = {}
+        for name, stats in self.stages.items():
+            stats = dict(stats, seconds=round(stats['seconds'], 4), self_seconds=round(stats['self_seconds'], 4))
+            if stats.get('pages') and stats['seconds']:
+                stats['pages_per_sec'] = round(stats['pages'] / stats['seconds'], 1)
+            stages[name] = stats
+        return {
+            'name': self.name,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'wall_time': round(time.perf_counter() - self._start, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': stages,
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=4)
+        return path
+
+    def log(self, logger):
+        report = self.to_dict()
+        for name, stats in report['stages'].items():
+            counters = ', '.join(f"{key}={value}" for key, value in stats.items()
+                                 if key not in ('calls', 'seconds', 'self_seconds'))
+            logger.info("阶段 %s: %.3fs (不含子阶段 %.3fs, %d次) %s", name, stats['seconds'], stats['self_seconds'],
+                        stats['calls'], counters)
+        logger.info("总耗时 %.3fs, 峰值内存 %s MB", report['wall_time'], report['peak_rss_mb'])
+
+
+def merge_reports(reports):
+    """把多份 to_dict() 报告的各阶段耗时和计数相加，用于批量比对的汇总"""
+    merged = {}
+    for report in reports:
+        for name, stats in report['stages'].items():
+            total = merged.setdefault(name, {})
+            for key, value in stats.items():
+                if key != 'pages_per_sec':
+                    total[key] = total.get(key, 0) + value
+    for stats in merged.values():
+        stats['seconds'] = round(stats['seconds'], 4)
+        stats['self_seconds'] = round(stats['self_seconds'], 4)
+        if stats.get('pages') and stats['seconds']:
+            stats['pages_per_sec'] = round(stats['pages'] / stats['seconds'], 1)
+    return merged
+
+
+_report = RunReport()
+
+
+def current_report():
+    """当前运行报告；没有调用start_report时为进程级的默认报告"""
+    return _report
+
+
+def start_report(name=None):
+    """开始新的运行报告并设为当前报告"""
+    global _report
+    _report = RunReport(name)
+    return _report
+
+
+@contextlib.contextmanager
+def profiled(kind, output_dir):
+    """kind为cprofile或pyinstrument时剖析with块并把结果写到output_dir，kind为空时不剖析
+
+    只剖析当前进程，按页分片并行提取时子进程中的开销不包括在内。
+    """
+    if not kind:
+        yield None
+        return
+    if kind not in PROFILE_FILES:
+        raise ValueError(f"不支持的剖析方式: {kind}")
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, PROFILE_FILES[kind])
+
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("使用 --profile pyinstrument 需要先安装 pyinstrument")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield output_path
+        finally:
+            profiler.stop()
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield output_path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_path)  # 用 python -m pstats 或 snakeviz 查看
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+匹配结果索引
+compare_pdfs 写出 CommonParagraphs.json/.ndjson 的同时，把文本行和匹配记录写入
+SQLite（匹配表在page1、page2上建索引），查看页面只按可见页码分页读取匹配，
+不必下载和扫描整个结果文件。
+
+命令行：
+    python match_index.py 索引文件 --doc 1 --pages 3-5 --min-length 20
+"""
+
+import os
+import json
+import sqlite3
+import contextlib
+import argparse
+
+MATCH_INDEX_FILE = 'CommonParagraphs.sqlite3'
+MATCH_INDEX_VERSION = 2
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+INSERT_BATCH_SIZE = 1000
+
+
+def line_pages(paragraphs):
+    """每行的页码；TextStore直接使用其页码数组，不必为查页码逐行构造字典、读取原文"""
+    pages = getattr(paragraphs, 'pages', None)
+    return pages if pages is not None else [para['page'] for para in paragraphs]
+
+
+class MatchIndexBuilder:
+    """边比对边写入匹配索引；先写入临时文件，全部完成后再替换，读取方不会看到写了一半的索引
+
+    用法：
+        with MatchIndexBuilder(path, file1, file2, paragraphs1, paragraphs2) as index:
+            matches = index.record(matches)   # 透传(i, j, [公共子串])并写入索引
+            ...消费matches...
+    """
+
+    def __init__(self, path, file1, file2, paragraphs1, paragraphs2):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.file1 = file1
+        self.file2 = file2
+        self.paragraphs1 = paragraphs1
+        self.paragraphs2 = paragraphs2
+        self.pages1 = line_pages(paragraphs1)
+        self.pages2 = line_pages(paragraphs2)
+        self.count = 0
+        self.conn = None
+
+    def __enter__(self):
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        # 索引文件可以随时重建，写入时不需要日志和同步
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.executescript(
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE lines ("
+            " doc INTEGER NOT NULL, id INTEGER NOT NULL, page INTEGER NOT NULL, line INTEGER NOT NULL,"
+            " text TEXT NOT NULL, bbox TEXT, PRIMARY KEY (doc, id)) WITHOUT ROWID;"
+            "CREATE TABLE matches ("
+            " id INTEGER PRIMARY KEY, line1 INTEGER NOT NULL, line2 INTEGER NOT NULL,"
+            " page1 INTEGER NOT NULL, page2 INTEGER NOT NULL, length INTEGER NOT NULL, substrings TEXT NOT NULL);"
+        )
+        for doc, paragraphs in ((1, self.paragraphs1), (2, self.paragraphs2)):
+            self.conn.executemany(
+                "INSERT INTO lines (doc, id, page, line, text, bbox) VALUES (?, ?, ?, ?, ?, ?)",
+                ((doc, idx, para['page'], para['line'], para['text'],
+                  json.dumps(para['bbox']) if 'bbox' in para else None)
+                 for idx, para in enumerate(paragraphs))
+            )
+        return self
+
+    def record(self, matches):
+        """透传匹配记录(i, j, [公共子串])，同时分批写入索引；length为其中最长子串的长度"""
+        batch = []
+        for i, j, substrings in matches:
+            self.count += 1
+            batch.append((self.count, i, j, self.pages1[i], self.pages2[j],
+                          max(map(len, substrings)), json.dumps(substrings, ensure_ascii=False)))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                self._insert(batch)
+                batch = []
+            yield i, j, substrings
+        self._insert(batch)
+
+    def _insert(self, batch):
+        self.conn.executemany(
+            "INSERT INTO matches (id, line1, line2, page1, page2, length, substrings) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                # 数据写完后再建索引，比逐行维护索引快
+                self.conn.executescript(
+                    "CREATE INDEX idx_matches_page1 ON matches (page1, length);"
+                    "CREATE INDEX idx_matches_page2 ON matches (page2, length);"
+                )
+                self.conn.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)",
+                    (('version', str(MATCH_INDEX_VERSION)), ('file1', self.file1), ('file2', self.file2),
+                     ('matches', str(self.count)))
+                )
+                self.conn.commit()
+        finally:
+            self.conn.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        return False
+
+
+@contextlib.contextmanager
+def _connect(path):
+    # 以只读方式打开，索引不存在时直接报错而不是创建空库
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"匹配索引不存在: {path}")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def index_info(path):
+    """索引的元信息：version、file1、file2、matches"""
+    with _connect(path) as conn:
+        info = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        pages = {doc: conn.execute(f"SELECT COALESCE(MAX(page{doc}), 0) FROM matches").fetchone()[0]
+                 for doc in (1, 2)}
+    info['version'] = int(info['version'])
+    info['matches'] = int(info['matches'])
+    info['last_page1'], info['last_page2'] = pages[1], pages[2]
+    return info
+
+
+def read_index(path):
+    """读出整个索引：(文档1的行, 文档2的行, [(行1下标, 行2下标, [公共子串])], 元信息)，用于增量比对"""
+    with _connect(path) as conn:
+        info = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if int(info['version']) != MATCH_INDEX_VERSION:
+            raise ValueError(f"匹配索引版本不符: {info['version']}")
+        docs = {1: [], 2: []}
+        for doc, page, line, text, bbox in conn.execute(
+                "SELECT doc, page, line, text, bbox FROM lines ORDER BY doc, id"):
+            para = {'page': page, 'line': line, 'text': text}
+            if bbox is not None:
+                para['bbox'] = json.loads(bbox)
+            docs[doc].append(para)
+        matches = [(line1, line2, json.loads(substrings)) for line1, line2, substrings in
+                   conn.execute("SELECT line1, line2, substrings FROM matches ORDER BY id")]
+    info['version'] = int(info['version'])
+    info['matches'] = int(info['matches'])
+    return docs[1], docs[2], matches, info
+
+
+def query_matches(path, doc=1, page_start=1, page_end=None, min_length=0, after=0, limit=DEFAULT_PAGE_SIZE):
+    """按文档doc(1或2)的页码范围和最小匹配长度读取一页匹配记录
+
+    记录与 CommonParagraphs.json 的 common_paragraphs 相同，另带 id；min_length 按记录中最长的
+    公共子串筛选。按 id 递增返回，
+    下一页从返回的 next 开始（after=next），没有更多记录时 next 为 None。
+    """
+    if doc not in (1, 2):
+        raise ValueError(f"doc只能是1或2: {doc}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page_column = f"m.page{doc}"
+    with _connect(path) as conn:
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('file1', 'file2')").fetchall())
+        rows = conn.execute(
+            "SELECT m.id, l1.page, l1.line, l1.text, l1.bbox, l2.page, l2.line, l2.text, l2.bbox, m.substrings"
+            " FROM matches m"
+            " JOIN lines l1 ON l1.doc = 1 AND l1.id = m.line1"
+            " JOIN lines l2 ON l2.doc = 2 AND l2.id = m.line2"
+            f" WHERE {page_column} >= ? AND {page_column} <= ? AND m.length >= ? AND m.id > ?"
+            " ORDER BY m.id LIMIT ?",
+            (page_start, page_end if page_end is not None else page_start, min_length, after, limit + 1)
+        ).fetchall()
+
+    records = []
+    for match_id, page1, line1, text1, bbox1, page2, line2, text2, bbox2, substrings in rows[:limit]:
+        record = {
+            'id': match_id,
+            'file1': meta['file1'],
+            'page1': page1,
+            'line1': line1,
+            'text1': text1,
+            'file2': meta['file2'],
+            'page2': page2,
+            'line2': line2,
+            'text2': text2,
+            'common_substrings': json.loads(substrings),
+        }
+        if bbox1 is not None:
+            record['bbox1'] = json.loads(bbox1)
+        if bbox2 is not None:
+            record['bbox2'] = json.loads(bbox2)
+        records.append(record)
+    return {'matches': records, 'next': records[-1]['id'] if len(rows) > limit else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按页查询匹配结果索引")
+    parser.add_argument('path', help=f"索引文件，即比对输出目录下的 {MATCH_INDEX_FILE}")
+    parser.add_argument('--doc', type=int, choices=[1, 2], default=1, help="按哪个文档的页码筛选")
+    parser.add_argument('--pages', default='1', help="页码或页码范围，例如 3 或 3-5")
+    parser.add_argument('--min-length', type=int, default=0, help="最小匹配长度")
+    args = parser.parse_args()
+
+    first, _, last = args.pages.partition('-')
+    print(json.dumps(index_info(args.path), ensure_ascii=False))
+    after = 0
+    while after is not None:
+        page = query_matches(args.path, args.doc, int(first), int(last or first), args.min_length, after)
+        for record in page['matches']:
+            print(f"{record['id']:>6} {record['page1']}:{record['line1']} - {record['page2']}:{record['line2']} "
+                  f"{' / '.join(record['common_substrings'])}")
+        after = page['next']
+
+
+if __name__ == '__main__':
+    main()
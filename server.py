@@ -1,33 +1,444 @@
-from flask import Flask, render_template, request, redirect, url_for,send_from_directory
-import subprocess
+from flask import Flask, render_template, request, url_for,send_from_directory, send_file, jsonify, abort, Response
 import os
+import gzip
+import json
+import time
+import uuid
+import shutil
+import mimetypes
+import queue
+import signal
+import threading
 import webbrowser
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+try:
+    import brotli  # 可选依赖，未安装时只提供gzip压缩
+except ImportError:
+    brotli = None
+# 在服务进程中预先导入比对模块（fitz/docx等），工作进程fork后无需重复导入
+from compare import (make_job, run_comparison_job, write_job_result, BATCH_COMMANDS, TEXT_ENGINES,
+                     EXTRACTION_BACKENDS, OUTPUT_FILES)
+from match_index import MATCH_INDEX_FILE, DEFAULT_PAGE_SIZE, query_matches, index_info
 app = Flask(__name__,static_folder='static')
 
+# ================== 比对任务 ==================
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'jobs')
+JOB_WORKERS = os.cpu_count() or 1
+JOB_TIMEOUT = 600  # 单个任务的超时秒数，None表示不限制
+ALLOWED_EXTENSIONS = {'.pdf', '.docx'}
+INPUT_FIELDS = ('file1', 'file2')
+FINISHED_STATUSES = {'ok', 'error', 'timeout'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 这些类型的结果文件按Accept-Encoding压缩后再发送
+COMPRESSIBLE_EXTENSIONS = {'.json', '.ndjson', '.html', '.txt'}
+
+_jobs = {}      # job_id -> 任务状态
+_options = {}   # job_id -> 尚未提交的任务参数
+_inputs = {}    # job_id -> {字段名: 上传文件路径}
+_pending = {}   # job_id -> 已提交、尚未结束的任务字典
+_running = {}   # job_id -> (工作进程pid, 开始时间)
+_timed_out = set()
+_jobs_lock = threading.Lock()
+
+# 工作进程池：JOB_WORKERS个槽位，每个槽位是只有一个常驻工作进程的进程池。一个任务独占一个
+# 槽位，工作进程崩溃或因超时被终止时只有该槽位的进程池损坏，其它正在执行的任务不受影响。
+_slot_executors = [None] * JOB_WORKERS
+_idle_slots = queue.Queue()     # 空闲槽位下标
+_waiting = queue.Queue()        # 等待空闲槽位的job_id
+_started = None                 # 工作进程开始执行任务时放入(job_id, pid)
+
+
+def _warm_worker(started):
+    """工作进程初始化：提前导入比对模块，spawn/forkserver方式启动的进程也不必在每个任务时导入"""
+    global _started
+    _started = started
+    import compare  # noqa: F401
+
+
+def _pool_job_main(job_id, job):
+    _started.put((job_id, os.getpid()))
+    return run_comparison_job(job)
+
+
+def _start_scheduler():
+    """按需启动调度线程和监视线程（避免debug模式的重载监视进程也创建工作进程）"""
+    global _started
+    with _jobs_lock:
+        if _started is not None:
+            return
+        _started = multiprocessing.Queue()
+    for slot in range(JOB_WORKERS):
+        _idle_slots.put(slot)
+    threading.Thread(target=_dispatch_jobs, daemon=True).start()
+    threading.Thread(target=_monitor_jobs, daemon=True).start()
+
+
+def _slot_executor(slot):
+    if _slot_executors[slot] is None:
+        _slot_executors[slot] = ProcessPoolExecutor(max_workers=1, initializer=_warm_worker, initargs=(_started,))
+    return _slot_executors[slot]
+
+
+def _dispatch_jobs():
+    """调度线程：按提交顺序把任务交给空闲槽位"""
+    while True:
+        job_id = _waiting.get()
+        slot = _idle_slots.get()
+        with _jobs_lock:
+            job = _pending[job_id]
+        try:
+            future = _slot_executor(slot).submit(_pool_job_main, job_id, job)
+        except BrokenProcessPool:
+            # 空闲的工作进程被终止（如超时检查与任务结束同时发生），重建后再提交
+            _slot_executors[slot] = None
+            future = _slot_executor(slot).submit(_pool_job_main, job_id, job)
+        future.add_done_callback(lambda f, job_id=job_id, slot=slot: _job_done(job_id, slot, f))
+
+
+def _monitor_jobs():
+    """记录任务开始执行的工作进程，终止超过JOB_TIMEOUT仍未结束的任务所在的进程"""
+    while True:
+        try:
+            job_id, pid = _started.get(timeout=1)
+            with _jobs_lock:
+                if job_id in _pending:
+                    _running[job_id] = (pid, time.monotonic())
+                    _jobs[job_id]['status'] = 'running'
+        except queue.Empty:
+            pass
+        if not JOB_TIMEOUT:
+            continue
+        now = time.monotonic()
+        with _jobs_lock:
+            expired = [(job_id, pid) for job_id, (pid, started) in _running.items()
+                       if now - started > JOB_TIMEOUT and job_id not in _timed_out]
+            _timed_out.update(job_id for job_id, _ in expired)
+        for job_id, pid in expired:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+def _job_done(job_id, slot, future):
+    try:
+        result = future.result()
+    except BrokenProcessPool:
+        # 槽位中只有这一个任务，进程池损坏说明正是它的工作进程崩溃或因超时被终止
+        _slot_executors[slot] = None
+        with _jobs_lock:
+            job = _pending[job_id]
+            timed_out = job_id in _timed_out
+        result = {key: job[key] for key in ('index', 'mode', 'file1', 'file2', 'output_dir')}
+        if timed_out:
+            result.update(status='timeout', error=f"超过{JOB_TIMEOUT}秒未完成")
+        else:
+            result.update(status='error', error="工作进程异常退出")
+        write_job_result(result)
+    except Exception as e:  # 任务本身的异常已由run_comparison_job捕获，这里只有提交、传输结果时的错误
+        result = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+
+    with _jobs_lock:
+        _jobs[job_id].update(status=result['status'], result=result, finished=time.time())
+        _pending.pop(job_id, None)
+        _running.pop(job_id, None)
+        _timed_out.discard(job_id)
+    _idle_slots.put(slot)
+
+
+def get_job_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return None if job is None else dict(job)
+
+
+def job_dir(job_id, *parts):
+    return os.path.join(JOBS_DIR, job_id, *parts)
+
+
+def _input_path(job_id, field, filename):
+    filename = secure_filename(filename or '') or field
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        abort(400, description=f"不支持的格式: {ext}")
+    # 两个文件可能同名，加上字段名前缀区分
+    return job_dir(job_id, 'input', f"{field}_{filename}")
+
+
+def _save_upload(job_id, field):
+    upload = request.files.get(field)
+    if upload is None or not upload.filename:
+        abort(400, description=f"缺少上传文件: {field}")
+    path = _input_path(job_id, field, upload.filename)
+    upload.save(path, buffer_size=UPLOAD_CHUNK_SIZE)
+    return path
+
+
+def _int_arg(name, default):
+    try:
+        return int(request.form.get(name, default))
+    except ValueError:
+        abort(400, description=f"参数{name}必须是整数")
+
+
+def _job_urls(job_id):
+    return {
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id),
+        'upload_urls': {field: url_for('job_input', job_id=job_id, field=field) for field in INPUT_FIELDS},
+        'start_url': url_for('start_job', job_id=job_id),
+        'viewer_url': url_for('static', filename='showpdf.html', job=job_id),
+    }
+
+
+def _choice_arg(name, default, choices):
+    value = request.form.get(name, default)
+    if value not in choices:
+        abort(400, description=f"参数{name}必须是以下之一: {', '.join(sorted(choices))}")
+    return value
+
+
+def _submit_job(job_id):
+    """两个输入文件都就绪后把任务提交到工作进程池，任务已经开始时返回False
+
+    状态检查和切换为queued在同一次加锁中完成，并发的start请求只有一个能提交。
+    """
+    with _jobs_lock:
+        if _jobs[job_id]['status'] != 'uploading':
+            return False
+        if set(_inputs[job_id]) != set(INPUT_FIELDS):
+            abort(409, description="需要先上传file1和file2")
+        options = _options.pop(job_id)
+        inputs = _inputs[job_id]
+        job = make_job(0, options.pop('mode'), inputs['file1'], inputs['file2'], job_dir(job_id, 'result'),
+                       **options)
+        _jobs[job_id]['status'] = 'queued'
+        _pending[job_id] = job
+    _start_scheduler()
+    _waiting.put(job_id)
+    return True
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """创建比对任务，返回任务ID和相关地址
+
+    表单字段：mode（text/image/all/pages，默认text），min_length、engine、backend、
+    output_format（可选，取值非法时返回400）。同时上传了file1、file2时立即开始比对；
+    否则任务处于uploading状态，由客户端通过PUT上传地址分块上传两个文件后再请求start_url。
+    """
+    mode = _choice_arg('mode', 'text', BATCH_COMMANDS)
+    options = {
+        'mode': mode,
+        'min_length': _int_arg('min_length', 13),
+        'engine': _choice_arg('engine', 'kgram', TEXT_ENGINES),
+        'backend': _choice_arg('backend', 'pymupdf', EXTRACTION_BACKENDS),
+        'output_format': _choice_arg('output_format', 'json', OUTPUT_FILES),
+    }
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_dir(job_id, 'input'))
+    inputs = {field: _save_upload(job_id, field) for field in INPUT_FIELDS if field in request.files}
+    if inputs and len(inputs) != len(INPUT_FIELDS):
+        abort(400, description="需要同时上传file1和file2")
+
+    with _jobs_lock:
+        _jobs[job_id] = {
+            'id': job_id,
+            'mode': mode,
+            'status': 'uploading',
+            'created': time.time(),
+            'finished': None,
+            'files': {field: os.path.basename(path) for field, path in inputs.items()},
+            'result': None,
+        }
+        _options[job_id] = options
+        _inputs[job_id] = inputs
+    if inputs:
+        _submit_job(job_id)
+
+    return jsonify({'id': job_id, 'status': get_job_status(job_id)['status'], **_job_urls(job_id)}), 202
+
+
+@app.route('/jobs/<job_id>/input/<field>', methods=['PUT'])
+def upload_job_input(job_id, field):
+    """以请求体分块流式写盘的方式上传一个输入文件，文件名由filename参数给出"""
+    status = get_job_status(job_id)
+    if status is None or field not in INPUT_FIELDS:
+        abort(404)
+    if status['status'] != 'uploading':
+        abort(409, description="任务已开始，不能再上传文件")
+
+    path = _input_path(job_id, field, request.args.get('filename'))
+    part_path = path + '.part'
+    with open(part_path, 'wb') as f:
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+    os.replace(part_path, path)
+
+    with _jobs_lock:
+        old_path = _inputs[job_id].get(field)
+        _inputs[job_id][field] = path
+        _jobs[job_id]['files'][field] = os.path.basename(path)
+    if old_path and old_path != path and os.path.exists(old_path):
+        os.remove(old_path)
+    return jsonify({'field': field, 'size': os.path.getsize(path)}), 201
+
+
+@app.route('/jobs/<job_id>/start', methods=['POST'])
+def start_job(job_id):
+    if get_job_status(job_id) is None:
+        abort(404)
+    if not _submit_job(job_id):
+        abort(409, description="任务已开始")
+    return jsonify(get_job_status(job_id)), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = get_job_status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """以Server-Sent Events推送任务状态，状态变化时发送，任务结束后关闭"""
+    if get_job_status(job_id) is None:
+        abort(404)
+
+    def stream():
+        last = None
+        while True:
+            status = get_job_status(job_id)
+            if status['status'] != last:
+                last = status['status']
+                yield f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+            if last in FINISHED_STATUSES:
+                return
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+# ================== 结果与输入文件下载 ==================
+def compressed_variant(path, encoding):
+    """返回path按encoding压缩后的副本路径，副本不存在或比原文件旧时重新生成"""
+    suffix = '.br' if encoding == 'br' else '.gz'
+    variant = path + suffix
+    if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+        return variant
+
+    tmp_path = f"{variant}.{uuid.uuid4().hex}.tmp"
+    if encoding == 'br':
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            compressor = brotli.Compressor(quality=5)
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+    else:
+        with open(path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+    os.replace(tmp_path, variant)
+    return variant
+
+
+def send_job_file(path, compress=False):
+    """发送文件，支持Range分段请求和ETag/Last-Modified条件请求
+
+    compress为True时按Accept-Encoding发送预先压缩的副本；压缩副本有自己的ETag，
+    Range作用于压缩后的内容。
+    """
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if os.path.splitext(path)[1].lower() == '.ndjson':
+        mimetype = 'application/x-ndjson'
+
+    encoding = None
+    if compress:
+        if brotli is not None and 'br' in request.accept_encodings:
+            encoding = 'br'
+        elif 'gzip' in request.accept_encodings:
+            encoding = 'gzip'
+    if encoding:
+        response = send_file(compressed_variant(path, encoding), mimetype=mimetype, conditional=True, etag=True,
+                             max_age=0)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=0)
+    if compress:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.route('/jobs/<job_id>/input/<field>', methods=['GET'])
+def job_input(job_id, field):
+    """输入文件（PDF.js按Range分段读取，不必先下载整个文件）"""
+    with _jobs_lock:
+        path = _inputs.get(job_id, {}).get(field)
+    return send_job_file(path)
+
+
+@app.route('/jobs/<job_id>/result/<path:name>')
+def job_result(job_id, name):
+    """任务输出目录中的文件，例如 JsonFromPdf/CommonParagraphs.json、result.json"""
+    if get_job_status(job_id) is None:
+        abort(404)
+    path = safe_join(job_dir(job_id, 'result'), name)
+    if path is None:
+        abort(404)
+    return send_job_file(path, compress=os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS)
+
+
+@app.route('/jobs/<job_id>/matches')
+def job_matches(job_id):
+    """按页分页读取匹配：doc=1|2，page_start、page_end（默认同page_start），min_length，after，limit
+
+    不带page_start时返回索引信息（匹配总数、有匹配的最大页码）。
+    """
+    if get_job_status(job_id) is None:
+        abort(404)
+    index_path = job_dir(job_id, 'result', 'JsonFromPdf', MATCH_INDEX_FILE)
+    if not os.path.exists(index_path):
+        abort(404, description="匹配索引尚未生成")
+
+    if 'page_start' not in request.args:
+        return jsonify(index_info(index_path))
+    try:
+        doc = int(request.args.get('doc', 1))
+        page_start = int(request.args['page_start'])
+        page_end = int(request.args.get('page_end', page_start))
+        min_length = int(request.args.get('min_length', 0))
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        return jsonify(query_matches(index_path, doc, page_start, page_end, min_length, after, limit))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/extractImage', methods=['POST'])
-def extract():
-    # 调用 ExtractImageFromPdf.py 脚本
-    subprocess.run(['python', 'ExtractImageFromPdf.py'])
-    return redirect(url_for('index'))
-    
-@app.route('/extractText', methods=['POST'])
-def text():
-    # 调用 compare.py 脚本
-    subprocess.run(['python', 'compare.py'])
-    return redirect(url_for('index'))
- 
- 
 @app.route('/OpenPdf', methods=['POST'])
 def show_pdf():
-    return send_from_directory(static_folder,'showpdf.html')   
+    return send_from_directory(app.static_folder,'showpdf.html')   
         
 @app.route('/paths.txt')
 def get_paths():
-    return send_from_directory(static_folder, 'paths.txt')
+    return send_from_directory(app.static_folder, 'paths.txt')
     
 if __name__ == '__main__':
-    app.run(debug=True, port=8080)
\ No newline at end of file
+    app.run(debug=True, port=8080, threaded=True)
\ No newline at end of file
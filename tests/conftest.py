@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 仓库的模块都在根目录下，没有打包安装
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+"""DOCX段落定位：用PyMuPDF生成的PDF代替LibreOffice的渲染结果，不依赖本机是否安装LibreOffice"""
+
+import fitz
+from docx import Document
+
+import compare
+
+PAGES = [
+    ["First paragraph on page one", "Second paragraph on page one"],
+    ["Third paragraph starts page two", "Fourth paragraph on page two"],
+]
+
+
+def make_document():
+    doc = Document()
+    for lines in PAGES:
+        for text in lines:
+            doc.add_paragraph(text)
+    return doc
+
+
+def write_rendered_pdf(pdf_path):
+    """模拟渲染结果：每页一段一行"""
+    with fitz.open() as pdf:
+        for lines in PAGES:
+            pdf.new_page().insert_text((72, 72), "\n".join(lines), fontsize=11)
+        pdf.save(pdf_path)
+    return pdf_path
+
+
+def test_layout_from_rendered_pdf(tmp_path):
+    pdf_path = write_rendered_pdf(str(tmp_path / "rendered.pdf"))
+    assert compare.layout_from_rendered_pdf(make_document(), pdf_path) == [(1, 1), (1, 2), (2, 1), (2, 2)]
+
+
+def test_get_docx_layout_uses_renderer(tmp_path, monkeypatch):
+    doc_path = str(tmp_path / "input.docx")
+    make_document().save(doc_path)
+    monkeypatch.setattr(compare, "find_docx_renderer", lambda: "soffice")
+    monkeypatch.setattr(compare, "render_docx_to_pdf",
+                        lambda path, output_dir: write_rendered_pdf(f"{output_dir}/input.pdf"))
+    assert compare.get_docx_layout(doc_path) == [[1, 1], [1, 2], [2, 1], [2, 2]]
@@ -0,0 +1,48 @@
+"""后缀数组引擎：极大公共子串与暴力解对照，跨行匹配映射回行"""
+
+import random
+
+import compare
+from text_store import TextStore
+
+
+def brute_force_maximal(text1, text2, min_length):
+    """所有长度不小于min_length、左右都无法再延伸的公共子串"""
+    found = set()
+    for a in range(len(text1)):
+        for b in range(len(text2)):
+            if a and b and text1[a - 1] == text2[b - 1]:
+                continue  # 向左还能延伸
+            length = 0
+            while a + length < len(text1) and b + length < len(text2) and text1[a + length] == text2[b + length]:
+                length += 1
+            if length >= min_length:
+                found.add((a, b, length))
+    return found
+
+
+def test_find_maximal_common_substrings_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(500):
+        alphabet = '的了是在和'[:rng.randint(1, 5)]
+        text1 = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        text2 = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        min_length = rng.randint(1, 6)
+        result = compare.find_maximal_common_substrings(text1, text2, min_length)
+        assert set(result) == brute_force_maximal(text1, text2, min_length)
+        assert len(result) == len(set(result))
+
+
+def make_store(lines):
+    return TextStore([{'page': 1, 'line': number, 'text': text} for number, text in enumerate(lines, start=1)])
+
+
+def test_short_pieces_of_cross_line_matches_are_dropped():
+    passage = '招标文件中规定的技术要求'
+    store1 = make_store(['甲方提供的', passage, '的乙方'])
+    store2 = make_store(['丙方准备的', passage, '的丁方'])
+    min_length = 5
+    matches = compare.find_maximal_common_substrings(store1.clean_text, store2.clean_text, min_length)
+    line_matches = sorted(compare.map_matches_to_lines(matches, store1, store2, min_length))
+    assert line_matches == [(1, 1, 0, 0, len(passage))]
+    assert list(compare.coalesce_line_matches(line_matches, store1)) == [(1, 1, [passage])]
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+紧凑的文本行存储
+extract_paragraphs 为每一行生成一个 {'page', 'line', 'text'[, 'bbox']} 字典，大文档
+有几十万个这样的小对象。TextStore 把一个文档的原文和清洗后的文本（只保留中文字符）
+各拼接成一个字符串，页码、行号、行起点、包围盒存放在 array 中，每行只占若干个整数；
+清洗在构建时只做一次。
+
+TextStore 实现了序列协议，按下标访问时才临时构造行字典，可以直接代替字典列表
+传给写出结果、建立索引的函数。构建时只需逐行迭代一遍，可以直接消费提取过程产出的
+生成器；比对只用到清洗后的文本，原文超过 spill_bytes 后移到临时文件，写出结果时再按行读取。
+"""
+
+import re
+import math
+import tempfile
+from array import array
+from collections.abc import Sequence
+
+# 比对只使用中文字符，与 compare.remove_special_chars 的清洗规则一致
+CJK_RUN = re.compile(r'[\u4e00-\u9fff]+')
+NO_BBOX = (math.nan,) * 4
+DEFAULT_SPILL_MB = 64
+JOIN_BATCH = 4096  # 清洗后的片段每累积这么多个就先拼接一次，避免大量小字符串对象
+
+
+class SpillBuffer:
+    """只追加的字节缓冲：超过max_bytes后把已有内容移到临时文件，此后的追加直接写入文件"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.memory = bytearray()
+        self.file = None
+        self.size = 0
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def append(self, data):
+        if self.file is None:
+            self.memory += data
+            if self.max_bytes is not None and len(self.memory) > self.max_bytes:
+                self.file = tempfile.TemporaryFile()
+                self.file.write(self.memory)
+                self.memory = bytearray()
+        else:
+            self.file.seek(0, 2)
+            self.file.write(data)
+        self.size += len(data)
+
+    def read(self, start, end):
+        if self.file is None:
+            return bytes(self.memory[start:end])
+        self.file.seek(start)
+        return self.file.read(end - start)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class TextStore(Sequence):
+    """一个文档的全部文本行
+
+    clean_text 为拼接后的清洗后文本，第i行占 [clean_starts[i], clean_starts[i + 1])；
+    原文以UTF-8存放在 original 中，第i行占 [byte_starts[i], byte_starts[i + 1]) 字节。
+    spill_bytes 为原文留在内存中的上限，None 表示不限制。
+    """
+
+    def __init__(self, paragraphs=(), spill_bytes=None):
+        self.pages = array('i')
+        self.lines = array('i')
+        self.byte_starts = array('q', [0])
+        self.clean_starts = array('q', [0])
+        self.bboxes = array('d')  # 每行4个数，没有包围盒时为NaN
+        self.original = SpillBuffer(spill_bytes)
+
+        clean_chunks = []
+        clean_parts = []
+        clean_length = 0
+        for para in paragraphs:
+            text = para['text']
+            for run in CJK_RUN.findall(text):
+                clean_parts.append(run)
+                clean_length += len(run)
+            if len(clean_parts) >= JOIN_BATCH:
+                clean_chunks.append(''.join(clean_parts))
+                clean_parts = []
+            self.original.append(text.encode('utf-8'))
+            self.pages.append(para['page'])
+            self.lines.append(para['line'])
+            self.byte_starts.append(self.original.size)
+            self.clean_starts.append(clean_length)
+            self.bboxes.extend(para.get('bbox', NO_BBOX))
+        clean_chunks.append(''.join(clean_parts))
+        self.clean_text = ''.join(clean_chunks)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        para = {'page': self.pages[i], 'line': self.lines[i], 'text': self.text(i)}
+        if not math.isnan(self.bboxes[4 * i]):
+            para['bbox'] = self.bboxes[4 * i:4 * i + 4].tolist()
+        return para
+
+    def text(self, i):
+        """第i行的原文"""
+        return self.original.read(self.byte_starts[i], self.byte_starts[i + 1]).decode('utf-8')
+
+    def close(self):
+        """删除原文的临时文件"""
+        self.original.close()
+
+    def clean(self, i):
+        """第i行清洗后的文本"""
+        return self.clean_text[self.clean_starts[i]:self.clean_starts[i + 1]]
+
+    def cleaned(self, rows=None):
+        """若干行（默认全部）清洗后文本的只读序列，访问时才切片"""
+        return CleanedLines(self, range(len(self)) if rows is None else rows)
+
+
+class CleanedLines(Sequence):
+    """TextStore中指定行的清洗后文本，按下标访问时从clean_text切片"""
+
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        return self.store.clean(self.rows[k])